@@ -0,0 +1,243 @@
+import os
+import sys
+import threading
+
+# --- PyFixer Entry Point ---
+#
+#   import pyfixer
+#   pyfixer.install()
+#
+# Registers sys.excepthook, threading.excepthook and (optionally) an asyncio loop exception
+# handler. Importing and installing costs only this module: PyQt6, the model SDK and the API
+# key are loaded the first time an error actually reaches one of the hooks (see fix_handler.py).
+# Check with:  python -X importtime -c "import pyfixer; pyfixer.install()"
+#
+# For servers and other long-running processes, install(mode="background") never blocks the
+# failing thread: errors are queued and a daemon worker stores fix suggestions (see fix_queue.py).
+# Errors your code catches itself can be sent with pyfixer.report_exception().
+#
+# install(hot_reload=True) loads accepted fixes into the running program instead of asking for a
+# restart (see hot_patch.py). That needs a program that survives the error: functions wrapped with
+# pyfixer.guard (the call is retried and its result returned) and asyncio loop errors. An error that
+# reaches sys.excepthook has already ended the program, so its fix is saved for a restart.
+#
+# Setting PYFIXER_TRACE_FILE and/or PYFIXER_METRICS_PORT turns on span tracing and metrics (see tracing.py).
+
+_install_lock = threading.Lock()
+_installed = False
+_previous_excepthook = None
+_previous_threading_excepthook = None
+_handling = threading.local()
+_mode = "interactive"
+_hot_reload = None
+_background = None
+_background_lock = threading.Lock()
+
+MODES = ("interactive", "background")
+
+
+def install(asyncio_loop=None, mode="interactive", suggestions_path=None, queue_size=None, queue_policy=None,
+            queue_locals=None, hot_reload=None):
+    """
+    Installs the error hooks. Safe to call more than once. Pass `asyncio_loop` (or call
+    install_asyncio_handler() later) to also catch errors in asyncio tasks and callbacks.
+    mode="background" queues errors for a worker thread instead of opening the fix dialog;
+    the queue options are passed to fix_queue.BackgroundFixer (queue_locals: its capture_locals).
+    hot_reload=True loads accepted fixes for errors the program survives (pyfixer.guard, asyncio)
+    into the running program instead of asking for a restart (default: PYFIXER_HOT_RELOAD).
+    Does nothing inside fix_verifier's sandbox (PYFIXER_VERIFYING), so replaying a fix never
+    opens a dialog or queues errors from the child process.
+    """
+    global _installed, _previous_excepthook, _previous_threading_excepthook, _mode, _hot_reload
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode '{mode}'. Use one of: {', '.join(MODES)}.")
+    if os.environ.get("PYFIXER_VERIFYING") == "1":
+        return
+    with _install_lock:
+        _mode = mode
+        _hot_reload = hot_reload
+        if mode == "background":
+            _get_background_fixer(suggestions_path, queue_size, queue_policy, queue_locals)
+        if not _installed:
+            _previous_excepthook = sys.excepthook
+            _previous_threading_excepthook = threading.excepthook
+            sys.excepthook = _excepthook
+            threading.excepthook = _threading_excepthook
+            _installed = True
+    if os.environ.get("PYFIXER_TRACE_FILE") or os.environ.get("PYFIXER_METRICS_PORT"):
+        from . import tracing
+        tracing.configure_from_env()
+    if asyncio_loop is not None:
+        install_asyncio_handler(asyncio_loop)
+
+
+def uninstall():
+    """
+    Restores the hooks that were active before install().
+    """
+    global _installed
+    with _install_lock:
+        if _installed:
+            sys.excepthook = _previous_excepthook
+            threading.excepthook = _previous_threading_excepthook
+            _installed = False
+
+
+def install_asyncio_handler(loop=None):
+    """
+    Sets the exception handler of `loop` (default: the running loop) to route errors to the fixer.
+    """
+    if loop is None:
+        import asyncio
+        loop = asyncio.get_running_loop()
+    loop.set_exception_handler(_asyncio_exception_handler)
+
+
+def report_exception(exc_value=None):
+    """
+    Queues an exception the application caught itself (default: the one being handled) for a
+    background fix suggestion. Returns immediately; returns False if the queue dropped it.
+    """
+    if exc_value is None:
+        exc_value = sys.exc_info()[1]
+        if exc_value is None:
+            return False
+    return _get_background_fixer().submit(type(exc_value), exc_value, exc_value.__traceback__)
+
+
+def guard(func):
+    """
+    Decorator for code that must keep running after an error, e.g. a request handler or job.
+    An error opens the fix dialog; when an accepted fix is hot reloaded (see install), the call is
+    run again with the same arguments, through the reloaded code, and its result returned; this
+    is the only retry (PYFIXER_HOT_RETRY does not apply). Otherwise the error propagates (and is
+    not shown a second time by the hooks).
+    """
+    import functools
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        try:
+            return func(*args, **kwargs)
+        except Exception as e:
+            handled = handle_exception(type(e), e, e.__traceback__, resumable=True, retry=False)
+            if isinstance(handled, bool):
+                raise
+        # A rebound fix replaced `func` on its module or class; this wrapper still holds the old one
+        _log().info("Retrying %s with the reloaded fix.", getattr(func, "__qualname__", func))
+        return handled.replacement_for(func)(*args, **kwargs)
+
+    return wrapper
+
+
+def _get_background_fixer(suggestions_path=None, queue_size=None, queue_policy=None, queue_locals=None):
+    global _background
+    with _background_lock:
+        if _background is None:
+            from . import fix_queue
+            options = {}
+            if suggestions_path:
+                options["suggestions_path"] = suggestions_path
+            if queue_size:
+                options["maxsize"] = queue_size
+            if queue_policy:
+                options["policy"] = queue_policy
+            if queue_locals is not None:
+                options["capture_locals"] = queue_locals
+            _background = fix_queue.BackgroundFixer(**options)
+    return _background
+
+
+def handle_exception(exc_type, exc_value, exc_traceback, resumable=False, retry=None):
+    """
+    Runs the fixer for one exception. The interactive Qt flow needs the main thread; errors from
+    other threads get a console-only suggestion. Only raises the SystemExit with which the handler
+    ends the program after saving an accepted fix for a restart. Returns False if the error was
+    skipped, else True, or the HotPatch when `resumable` (the program keeps running afterwards)
+    and an accepted fix was hot reloaded. `retry` goes to fix_handler.handle_application_error.
+    """
+    if (issubclass(exc_type, (KeyboardInterrupt, SystemExit)) or getattr(_handling, "active", False)
+            or getattr(exc_value, "_pyfixer_handled", False)):
+        return False
+    try:
+        exc_value._pyfixer_handled = True  # A guard re-raises it to the hooks; don't ask twice
+    except (AttributeError, TypeError):
+        pass
+    if _mode == "background":
+        try:
+            _get_background_fixer().submit(exc_type, exc_value, exc_traceback)
+        except Exception as e:
+            _log().error("Could not queue error: %r", e)
+        return True
+    _handling.active = True
+    try:
+        if threading.current_thread() is threading.main_thread():
+            from .fix_handler import handle_application_error
+            return handle_application_error(exc_type, exc_value, exc_traceback,
+                                            hot_reload=_hot_reload, resumable=resumable, retry=retry)
+        else:
+            suggest_fix_headless(exc_type, exc_value, exc_traceback)
+    except SystemExit:
+        # The handler exits after saving an accepted fix. Raised out of sys.excepthook it ends the
+        # process with that status, without the previous hook printing the traceback again
+        raise
+    except BaseException as e:
+        if e is not exc_value:
+            _log().error("Error handler failed: %r", e)
+        # The handler re-raises the original exception when no fix was applied
+    finally:
+        _handling.active = False
+    return True
+
+
+def suggest_fix_headless(exc_type, exc_value, exc_traceback):
+    """
+    Asks the model backend for a fix and prints it, without any UI.
+    """
+    import traceback
+    from .context_builder import code_qualnames, locate_failing_function, prepare_fix_prompt
+    from .gemini_fix import clean_fix_response
+    from .model_backend import get_backend
+    from .frame_snapshot import capture_snapshot
+
+    frames = traceback.extract_tb(exc_traceback)
+    error_info = {
+        "type": exc_type.__name__,
+        "message": str(exc_value),
+        "traceback": "".join(traceback.format_exception(exc_type, exc_value, exc_traceback)),
+        "locals": capture_snapshot(exc_traceback, release=False).format(),
+    }
+    source_lines, start_line, failing_line = [], 1, None
+    located = locate_failing_function(frames, code_qualnames(exc_traceback))
+    if located is not None:
+        file_index, span, position = located
+        source_lines = file_index.lines[span.start_line - 1:span.end_line]
+        start_line, failing_line = span.start_line, frames[position].lineno
+    fix_prompt = prepare_fix_prompt(error_info, frames, source_lines, start_line, failing_line)
+    fix = fix_prompt.request(lambda prompt: clean_fix_response(get_backend().generate(prompt)))
+    _log().info("Suggested fix for %s in thread '%s':\n%s", error_info["type"], threading.current_thread().name, fix)
+
+
+def _log():
+    from .tracing import get_logger
+    return get_logger("PyFixer")
+
+
+def _excepthook(exc_type, exc_value, exc_traceback):
+    handle_exception(exc_type, exc_value, exc_traceback)
+    _previous_excepthook(exc_type, exc_value, exc_traceback)
+
+
+def _threading_excepthook(args):
+    if args.exc_value is not None:
+        handle_exception(args.exc_type, args.exc_value, args.exc_traceback)
+    _previous_threading_excepthook(args)
+
+
+def _asyncio_exception_handler(loop, context):
+    exception = context.get("exception")
+    if exception is not None:
+        # The loop keeps running, so an accepted fix can be hot reloaded
+        if not isinstance(handle_exception(type(exception), exception, exception.__traceback__, resumable=True), bool):
+            return
+    loop.default_exception_handler(context)
@@ -0,0 +1,286 @@
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from . import tracing
+from .fingerprint import ClusterIndex, frame_signature, parse_traceback_text
+from .fix_cache import FixCache, make_cache_key
+from .gemini_fix import build_fix_prompt, clean_fix_response
+from .model_backend import get_backend
+from .patch_engine import source_index
+from .context_builder import estimate_tokens
+
+# --- Batch Triage Mode ---
+# Headless CLI that reads crash reports from a JSONL file, deduplicates them and asks
+# the model backend (see model_backend.py) for fixes through a bounded, rate-limited thread pool.
+#
+#   python -m pyfixer.batch_triage crashes.jsonl -o fixes.jsonl --workers 8 --rate 2
+#
+# Each input line is a JSON object with "type", "message", "traceback" and optionally
+# "source_path". Records are clustered by traceback fingerprint (see fingerprint.py) and one
+# result line per cluster is written as soon as it completes.
+
+log = tracing.get_logger("Batch")
+
+
+def iter_error_records(path, stats):
+    """
+    Yields error records one line at a time; the input file is never loaded whole.
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            stats["read"] += 1
+            try:
+                record = json.loads(line)
+            except ValueError:
+                stats["invalid"] += 1
+                log.warning("Skipping invalid JSON on line %d.", line_number)
+                continue
+            if not isinstance(record, dict) or not (record.get("type") or record.get("traceback")):
+                stats["invalid"] += 1
+                continue
+            yield record
+
+
+def extract_source_snippet(record, frames):
+    """
+    Returns (function_name, source) for the innermost frame in the record's source file, if readable.
+    """
+    source_path = record.get("source_path")
+    if not source_path or not os.path.isfile(source_path):
+        return None, ""
+    target = os.path.abspath(source_path)
+    for frame in reversed(frames):
+        if os.path.abspath(frame.filename) == target or os.path.basename(frame.filename) == os.path.basename(target):
+            try:
+                file_index = source_index.get(target)
+            except (OSError, SyntaxError, ValueError):  # ValueError covers undecodable files
+                return None, ""
+            span = file_index.enclosing(frame.lineno, frame.name)
+            if span is not None:
+                return span.qualname, file_index.source_of(span)
+    return None, ""
+
+
+class RateLimiter:
+    """
+    Token bucket shared by all worker threads: at most `rate` calls per second, bursts up to `burst`.
+    """
+
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if not self.rate or self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                sleep_for = (1 - self.tokens) / self.rate
+            time.sleep(sleep_for)
+
+
+def call_with_retry(func, retries=3, base_delay=1.0, max_delay=30.0):
+    """
+    Calls `func()` and retries failures with exponential backoff plus jitter.
+    Returns (result, attempts); re-raises the last error when retries are exhausted.
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        try:
+            return func(), attempt
+        except Exception as e:
+            if attempt > retries:
+                raise
+            delay = min(max_delay, base_delay * (2 ** (attempt - 1))) * (0.5 + random.random())
+            tracing.incr("api_retries")
+            log.warning("Attempt %d failed (%s); retrying in %.1fs.", attempt, e, delay)
+            time.sleep(delay)
+
+
+class BatchTriage:
+    """
+    Runs the dedupe -> rate-limited model call -> JSONL output pipeline.
+    """
+
+    def __init__(self, generate_fix, workers=4, rate=1.0, retries=3, max_inflight=None, cache=None):
+        self.generate_fix = generate_fix  # Callable(prompt) -> raw response text
+        self.workers = workers
+        self.rate_limiter = RateLimiter(rate, burst=workers)
+        self.retries = retries
+        self.max_inflight = max_inflight or workers * 2
+        self.cache = cache
+        self.clusters = ClusterIndex()
+        self.stats = {"read": 0, "invalid": 0, "duplicates": 0, "unique": 0,
+                      "fixed": 0, "no_fix": 0, "failed": 0, "cache_hits": 0}
+
+    def _triage_one(self, key, record, frames):
+        # One bad report must never end the run, so anything unexpected becomes a failed result
+        try:
+            return self._triage_record(key, record, frames)
+        except Exception as e:
+            log.warning("Could not triage cluster %s: %r", key, e)
+            return {"cluster_id": key, "type": record.get("type"), "message": record.get("message"),
+                    "source_path": record.get("source_path"), "function": None,
+                    "status": "failed", "error": repr(e)}
+
+    def _triage_record(self, key, record, frames):
+        # `key` is the cluster id; the cache key also covers the source, so a fix cached
+        # against an older version of the function is not reused.
+        started = time.perf_counter()
+        function_name, snippet = extract_source_snippet(record, frames)
+        result = {
+            "cluster_id": key,
+            "type": record.get("type"),
+            "message": record.get("message"),
+            "source_path": record.get("source_path"),
+            "function": function_name,
+        }
+
+        cache_key = make_cache_key(record.get("type"), record.get("message"), frame_signature(frames), snippet)
+        fix = self.cache.get(cache_key) if self.cache is not None else None
+        if fix is not None:
+            result.update(status="fixed", fix=fix, attempts=0, cached=True)
+        else:
+            error_info = {"type": record.get("type"), "message": record.get("message"),
+                          "traceback": record.get("traceback"), "locals": record.get("locals")}
+            prompt = build_fix_prompt(error_info, snippet or "Source not available.")
+
+            def attempt():
+                self.rate_limiter.acquire()
+                tracing.incr("api_calls")
+                tracing.incr("tokens_sent", estimate_tokens(prompt))
+                with tracing.span("api", cluster_id=key):
+                    return self.generate_fix(prompt)
+
+            try:
+                response_text, attempts = call_with_retry(attempt, retries=self.retries)
+                fix = clean_fix_response(response_text)
+                result.update(status="no_fix" if fix == "NO_FIX_AVAILABLE" else "fixed", fix=fix, attempts=attempts)
+                if fix != "NO_FIX_AVAILABLE" and self.cache is not None:
+                    self.cache.put(cache_key, fix, filepath=record.get("source_path"), function_name=function_name)
+            except Exception as e:
+                result.update(status="failed", error=str(e), attempts=self.retries + 1)
+
+        result["elapsed"] = round(time.perf_counter() - started, 3)
+        return result
+
+    def run(self, input_path, output_path, clusters_path=None):
+        pending = set()
+        started = time.perf_counter()
+        last_report = started
+
+        def drain(futures, out):
+            for future in futures:
+                result = future.result()
+                if result.get("cached"):
+                    self.stats["cache_hits"] += 1
+                self.stats[result["status"]] += 1
+                out.write(json.dumps(result) + "\n")
+                out.flush()
+
+        with open(output_path, "a", encoding="utf-8") as out, ThreadPoolExecutor(max_workers=self.workers) as pool:
+            for record in iter_error_records(input_path, self.stats):
+                # Write results as they finish, even while a run of duplicates submits nothing new
+                if pending:
+                    done, pending = wait(pending, timeout=0)
+                    drain(done, out)
+                frames = parse_traceback_text(record.get("traceback"))
+                cluster, is_new = self.clusters.add(record.get("type"), record.get("message"), frames)
+                if not is_new:
+                    self.stats["duplicates"] += 1
+                    continue
+                self.stats["unique"] += 1
+
+                # Bounded in-flight work keeps memory flat regardless of input size
+                if len(pending) >= self.max_inflight:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    drain(done, out)
+                pending.add(pool.submit(self._triage_one, cluster.cluster_id, record, frames))
+
+                now = time.perf_counter()
+                if now - last_report >= 10:
+                    last_report = now
+                    self.report(now - started)
+
+            done, _ = wait(pending)
+            drain(done, out)
+
+        if clusters_path:
+            self.write_clusters(clusters_path)
+        elapsed = time.perf_counter() - started
+        self.report(elapsed, final=True)
+        return self.stats
+
+    def write_clusters(self, clusters_path):
+        """
+        Writes one line per cluster with its occurrence count, largest first.
+        """
+        with open(clusters_path, "w", encoding="utf-8") as f:
+            for cluster in sorted(self.clusters.clusters(), key=lambda c: c.count, reverse=True):
+                summary = cluster.to_dict()
+                summary.pop("sample")
+                f.write(json.dumps(summary) + "\n")
+
+    def report(self, elapsed, final=False):
+        completed = self.stats["fixed"] + self.stats["no_fix"] + self.stats["failed"]
+        throughput = self.stats["read"] / elapsed if elapsed > 0 else 0.0
+        label = "Finished" if final else "Progress"
+        log.info("%s: %d read, %d unique, %d completed in %.1fs (%.1f errors/s). %s",
+                 label, self.stats["read"], self.stats["unique"], completed, elapsed, throughput, self.stats)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless batch triage of crash reports with Gemini.")
+    parser.add_argument("input", help="JSONL file of error records (type, message, traceback, source_path)")
+    parser.add_argument("-o", "--output", help="JSONL file for results (default: <input>.fixes.jsonl)")
+    parser.add_argument("--workers", type=int, default=4, help="Concurrent model requests")
+    parser.add_argument("--rate", type=float, default=1.0, help="Max model requests per second (0 = unlimited)")
+    parser.add_argument("--retries", type=int, default=3, help="Retries per request with exponential backoff")
+    parser.add_argument("--clusters", help="Also write per-cluster occurrence counts to this JSONL file")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read or write the fix cache")
+    parser.add_argument("--trace", metavar="FILE", help="Write timing spans to this JSONL file")
+    parser.add_argument("--metrics-port", type=int, help="Serve Prometheus metrics on this port while running")
+    args = parser.parse_args(argv)
+
+    if args.trace or args.metrics_port is not None:
+        tracing.configure(jsonl_path=args.trace, prometheus_port=args.metrics_port)
+    else:
+        tracing.configure_from_env()
+
+    backend = get_backend()
+    try:
+        backend.check()
+    except Exception as e:
+        print(f"FATAL ERROR: Model backend configuration failed. Error: {e}")
+        return 1
+
+    triage = BatchTriage(
+        backend.generate,
+        workers=args.workers, rate=args.rate, retries=args.retries,
+        cache=None if args.no_cache else FixCache(),
+    )
+    triage.run(args.input, args.output or args.input + ".fixes.jsonl", clusters_path=args.clusters)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
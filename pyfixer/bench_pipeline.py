@@ -0,0 +1,335 @@
+import os
+import sys
+import json
+import time
+import shutil
+import platform
+import argparse
+import tempfile
+import importlib
+import traceback
+import tracemalloc
+import contextlib
+from datetime import datetime
+
+from .model_backend import ModelBackend, create_backend
+from .local_fix_server import FixResponder
+from .gemini_fix import clean_fix_response
+from .context_builder import code_qualnames, locate_failing_function, prepare_fix_prompt, ElisionError
+from .patch_engine import apply_function_fixes, SourceIndex, PatchError
+
+# --- Pipeline Benchmark ---
+# Generates a corpus of faulty functions (many exception types, files from a few hundred to
+# 10k+ lines), triggers each error and runs the headless pipeline stages on it:
+#   capture   traceback.extract_tb + format_exception
+#   lookup    locate_failing_function, as in every fix path
+#   prompt    prepare_fix_prompt (token-budgeted context + build_fix_prompt)
+#   model     backend.generate (in-process FixResponder by default, no network)
+#   clean     clean_fix_response + FixPrompt.restore
+#   patch     apply_function_fixes on a scratch copy of the corpus
+# Reports p50/p95/p99 per stage plus peak traced memory (measured in a separate pass, so
+# tracemalloc does not distort the timings), and stores everything as JSON.
+#
+#   python -m pyfixer.bench_pipeline -o bench.json
+#   python -m pyfixer.bench_pipeline -o new.json --compare bench.json --threshold 20
+
+STAGES = ("capture", "lookup", "prompt", "model", "clean", "patch")
+DEFAULT_FILE_SIZES = (200, 2000, 12000)
+DEFAULT_FUNCTION_SIZES = (3, 40, 400)
+
+# Exception type -> (function template, arguments that trigger it)
+FAULT_TEMPLATES = {
+    "ZeroDivisionError": ("def {name}(a, b):\n{filler}    ratio = a / b\n    return ratio\n", (10, 0)),
+    "KeyError": ("def {name}(data, key):\n{filler}    value = data[key]\n    return value\n", ({"a": 1}, "missing")),
+    "IndexError": ("def {name}(items, i):\n{filler}    return items[i]\n", ([1, 2], 5)),
+    "TypeError": ("def {name}(a, b):\n{filler}    total = a + b\n    return total\n", (1, "x")),
+    "AttributeError": ("def {name}(obj, n):\n{filler}    return obj.missing_attribute + n\n", (None, 1)),
+    "ValueError": ("def {name}(text, base):\n{filler}    return int(text, base)\n", ("abc", 10)),
+    "UnboundLocalError": ("def {name}(flag, n):\n{filler}    if flag:\n        result = n\n    return result\n", (False, 1)),
+    "AssertionError": ("def {name}(a, b):\n{filler}    assert a < b, 'a must be smaller'\n    return b - a\n", (2, 1)),
+    "FileNotFoundError": ("def {name}(path, mode):\n{filler}    with open(path, mode) as f:\n        return f.read()\n", ("/nonexistent/pyfixer-bench.txt", "r")),
+}
+
+
+class ResponderBackend(ModelBackend):
+    """
+    In-process mock backend: the stand-in server's FixResponder plus optional fixed latency.
+    Errors without a built-in rule get their snippet echoed back, so every case reaches the patch stage.
+    """
+
+    def __init__(self, latency=0.0, canned=None):
+        super().__init__()
+        self.responder = FixResponder(canned, echo=True)
+        self.latency = latency
+
+    def generate(self, prompt, temperature=None):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.responder.respond(prompt)
+
+
+# --- Corpus ---
+def _filler_statements(count, seed):
+    return "".join(f"    v{i} = ({seed} + {i}) * 2\n" for i in range(count))
+
+
+def generate_corpus(directory, file_sizes=DEFAULT_FILE_SIZES, function_sizes=DEFAULT_FUNCTION_SIZES):
+    """
+    Writes one module per file size into `directory`, each padded with filler functions to
+    about that many lines, with faulty functions at the start, middle and end. Function sizes
+    that would not fit the file size are skipped for that file.
+    Returns a list of cases: (module name, function name, exception type, args, file lines).
+    """
+    cases = []
+    for file_size in file_sizes:
+        module = f"bench_corpus_{file_size}"
+        faulty = []
+        fitting_sizes = [s for s in function_sizes if s * len(FAULT_TEMPLATES) * 2 <= file_size] or [min(function_sizes)]
+        for type_index, (error_type, (template, args)) in enumerate(FAULT_TEMPLATES.items()):
+            for size in fitting_sizes:
+                name = f"fault_{error_type.lower()}_{size}"
+                faulty.append((name, error_type, args, template.format(name=name, filler=_filler_statements(size, type_index))))
+        fault_lines = sum(code.count("\n") + 1 for *_, code in faulty)
+        filler_count = max(0, (file_size - fault_lines) // 4)
+        fillers = [f"def filler_{n}(x):\n    y = x + {n}\n    return y * 2\n" for n in range(filler_count)]
+
+        # Spread the faulty functions across the file so lookups are not all near the top
+        blocks = list(fillers)
+        for i, (_, _, _, code) in enumerate(faulty):
+            blocks.insert(int(len(blocks) * i / max(len(faulty), 1)) + i, code)
+        text = "# Generated by bench_pipeline.py\n\n" + "\n".join(blocks)
+        with open(os.path.join(directory, module + ".py"), "w", encoding="utf-8") as f:
+            f.write(text)
+        line_count = text.count("\n")
+        cases.extend((module, name, error_type, args, line_count) for name, error_type, args, _ in faulty)
+    return cases
+
+
+# --- Stages ---
+class StageTimer:
+    """
+    Collects per-stage durations and, when tracing memory, the peak allocation of each stage.
+    """
+
+    def __init__(self, trace_memory=False):
+        self.samples = {stage: [] for stage in STAGES}
+        self.peaks = {stage: 0 for stage in STAGES}
+        self.trace_memory = trace_memory
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.samples[name].append(time.perf_counter_ns() - started)
+            if self.trace_memory:
+                self.peaks[name] = max(self.peaks[name], tracemalloc.get_traced_memory()[1] - baseline)
+
+
+def run_case(timer, module, function_name, args, backend, patch_dir, patch_index):
+    func = getattr(module, function_name)
+    try:
+        func(*args)
+        raise RuntimeError(f"{function_name} did not raise")
+    except RuntimeError:
+        raise
+    except Exception:
+        exc_type, exc_value, exc_traceback = sys.exc_info()
+
+    with timer.stage("capture"):
+        tb_frames = traceback.extract_tb(exc_traceback)
+        error_info = {
+            "type": exc_type.__name__,
+            "message": str(exc_value),
+            "traceback": "".join(traceback.format_exception(exc_type, exc_value, exc_traceback)),
+        }
+
+    with timer.stage("lookup"):
+        source_lines, start_line, failing_line = [], 1, None
+        located = locate_failing_function(tb_frames, code_qualnames(exc_traceback))
+        if located is not None:
+            file_index, span, position = located
+            source_lines = file_index.lines[span.start_line - 1:span.end_line]
+            start_line, failing_line = span.start_line, tb_frames[position].lineno
+
+    with timer.stage("prompt"):
+        fix_prompt = prepare_fix_prompt(error_info, tb_frames, source_lines, start_line, failing_line)
+
+    with timer.stage("model"):
+        response = backend.generate(fix_prompt.prompt)
+
+    with timer.stage("clean"):
+        try:
+            fix = fix_prompt.restore(clean_fix_response(response))
+        except ElisionError:
+            fix = "NO_FIX_AVAILABLE"
+
+    del exc_traceback
+    if fix == "NO_FIX_AVAILABLE":
+        return False
+    with timer.stage("patch"):
+        try:
+            apply_function_fixes(os.path.join(patch_dir, module.__name__ + ".py"), {function_name: fix}, index=patch_index)
+        except PatchError:
+            return False
+    return True
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(fraction * (len(sorted_values) - 1)))))
+    return sorted_values[index]
+
+
+def summarize(samples_ns, peaks=None):
+    summary = {}
+    for stage, values in samples_ns.items():
+        ordered = sorted(values)
+        summary[stage] = {
+            "count": len(ordered),
+            "p50_ms": round(_percentile(ordered, 0.50) / 1e6, 4),
+            "p95_ms": round(_percentile(ordered, 0.95) / 1e6, 4),
+            "p99_ms": round(_percentile(ordered, 0.99) / 1e6, 4),
+            "mean_ms": round(sum(ordered) / len(ordered) / 1e6, 4) if ordered else 0.0,
+            "max_ms": round(ordered[-1] / 1e6, 4) if ordered else 0.0,
+        }
+        if peaks is not None:
+            summary[stage]["peak_kib"] = round(peaks.get(stage, 0) / 1024, 1)
+    return summary
+
+
+def run_benchmark(iterations=3, file_sizes=DEFAULT_FILE_SIZES, function_sizes=DEFAULT_FUNCTION_SIZES,
+                  backend=None, memory=True, keep_dir=None):
+    """
+    Generates the corpus, runs every case `iterations` times and returns the results dict.
+    """
+    backend = backend or ResponderBackend()
+    work_dir = keep_dir or tempfile.mkdtemp(prefix="pyfixer-bench-")
+    corpus_dir = os.path.join(work_dir, "corpus")
+    os.makedirs(corpus_dir, exist_ok=True)
+    cases = generate_corpus(corpus_dir, file_sizes, function_sizes)
+    sys.path.insert(0, corpus_dir)
+    modules = {name: importlib.import_module(name) for name in {case[0] for case in cases}}
+
+    timer = StageTimer()
+    by_size = {}
+    fixed = 0
+    passes = [("timing", timer)] * iterations
+    if memory:
+        passes.append(("memory", StageTimer(trace_memory=True)))
+    try:
+        with open(os.devnull, "w") as sink, contextlib.redirect_stdout(sink):
+            for pass_name, pass_timer in passes:
+                # Fresh scratch copy and index per pass, so every patch hits an unpatched function
+                patch_dir = os.path.join(work_dir, "patched")
+                shutil.rmtree(patch_dir, ignore_errors=True)
+                shutil.copytree(corpus_dir, patch_dir)
+                patch_index = SourceIndex()
+                if pass_name == "memory":
+                    tracemalloc.start()
+                for module_name, function_name, error_type, args, line_count in cases:
+                    size_timer = by_size.setdefault(line_count, StageTimer()) if pass_name == "timing" else None
+                    before = {stage: len(pass_timer.samples[stage]) for stage in STAGES}
+                    ok = run_case(pass_timer, modules[module_name], function_name, args, backend, patch_dir, patch_index)
+                    if pass_name == "timing":
+                        fixed += ok
+                        for stage in STAGES:
+                            size_timer.samples[stage].extend(pass_timer.samples[stage][before[stage]:])
+                if pass_name == "memory":
+                    tracemalloc.stop()
+    finally:
+        sys.path.remove(corpus_dir)
+        for name in modules:
+            sys.modules.pop(name, None)
+        if keep_dir is None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    memory_timer = passes[-1][1] if memory else None
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": type(backend).__name__,
+            "iterations": iterations,
+            "cases": len(cases),
+            "exception_types": sorted(FAULT_TEMPLATES),
+            "file_lines": sorted(by_size),
+            "function_sizes": list(function_sizes),
+            "fix_rate": round(fixed / max(len(cases) * iterations, 1), 3),
+        },
+        "stages": summarize(timer.samples, memory_timer.peaks if memory_timer else None),
+        "by_file_lines": {str(lines): summarize(t.samples) for lines, t in sorted(by_size.items())},
+    }
+
+
+def compare_results(baseline, current, threshold_percent=20.0, metric="p95_ms"):
+    """
+    Prints per-stage changes of `metric` and returns the stages that got slower than `threshold_percent`.
+    """
+    regressions = []
+    print(f"{'stage':<10}{'baseline':>12}{'current':>12}{'change':>10}")
+    for stage in STAGES:
+        old = baseline.get("stages", {}).get(stage, {}).get(metric)
+        new = current.get("stages", {}).get(stage, {}).get(metric)
+        if old is None or new is None:
+            continue
+        change = (new - old) / old * 100 if old else 0.0
+        flag = ""
+        if change > threshold_percent and new - old > 0.05:  # Ignore sub-50µs noise on tiny stages
+            regressions.append(stage)
+            flag = "  REGRESSION"
+        print(f"{stage:<10}{old:>12.3f}{new:>12.3f}{change:>9.1f}%{flag}")
+    return regressions
+
+
+def print_summary(results):
+    meta = results["meta"]
+    print(f"[Bench] {meta['cases']} cases x {meta['iterations']} iterations, files of {meta['file_lines']} lines, "
+          f"backend {meta['backend']}, fix rate {meta['fix_rate']:.0%}")
+    print(f"{'stage':<10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak KiB':>11}")
+    for stage, s in results["stages"].items():
+        print(f"{stage:<10}{s['p50_ms']:>10.3f}{s['p95_ms']:>10.3f}{s['p99_ms']:>10.3f}{s.get('peak_kib', 0):>11.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the PyFixer pipeline stages on a synthetic corpus.")
+    parser.add_argument("-o", "--output", help="Write results as JSON to this file")
+    parser.add_argument("--compare", metavar="BASELINE", help="Compare against an earlier results file")
+    parser.add_argument("--threshold", type=float, default=20.0, help="p95 slowdown (percent) reported as a regression")
+    parser.add_argument("--iterations", type=int, default=3)
+    parser.add_argument("--file-sizes", default=",".join(map(str, DEFAULT_FILE_SIZES)), help="Comma-separated corpus file sizes in lines")
+    parser.add_argument("--function-sizes", default=",".join(map(str, DEFAULT_FUNCTION_SIZES)), help="Comma-separated filler statements per faulty function")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every mocked model call")
+    parser.add_argument("--backend", help="Use a real backend spec instead of the in-process mock (e.g. http://127.0.0.1:8765)")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc pass")
+    parser.add_argument("--keep", metavar="DIR", help="Generate the corpus in DIR and keep it")
+    args = parser.parse_args(argv)
+
+    backend = create_backend(args.backend) if args.backend else ResponderBackend(args.latency)
+    results = run_benchmark(
+        iterations=args.iterations,
+        file_sizes=[int(x) for x in args.file_sizes.split(",") if x],
+        function_sizes=[int(x) for x in args.function_sizes.split(",") if x],
+        backend=backend, memory=not args.no_memory, keep_dir=args.keep,
+    )
+    print_summary(results)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"[Bench] Results written to {args.output}")
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if compare_results(baseline, results, args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
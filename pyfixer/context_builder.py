@@ -0,0 +1,354 @@
+import os
+import re
+import ast
+import textwrap
+import traceback
+
+from .fingerprint import normalize_path
+from .gemini_fix import build_fix_prompt
+from .patch_engine import source_index
+from .tracing import get_logger
+
+# --- Token-Budgeted Context Extraction ---
+# Instead of the whole function and the whole traceback, the prompt gets:
+#   * the function signature, the failing statement and the headers of the blocks around it,
+#   * the earlier statements that assign the names the failing statement reads (transitively),
+#   * only the project frames (callers) closest to the failure.
+# Omitted source lines are replaced by a marker naming their line range, which the model is asked
+# to copy through; expand_elided_lines() restores them before the fix is offered or patched in.
+# A fix that drops one of the prompt's markers would delete those lines, so it is refused
+# (ElisionError) and callers ask again with the full function source.
+
+DEFAULT_TOKEN_BUDGET = int(os.environ.get("PYFIXER_TOKEN_BUDGET", "1500"))
+DEFAULT_MAX_CALLERS = 2
+PROMPT_OVERHEAD_TOKENS = 200  # Fixed instructions in build_fix_prompt
+
+ELISION_MARKER = "# ... [pyfixer: lines {start}-{end} unchanged]"
+log = get_logger("Context")
+
+_ELISION_RE = re.compile(r"^(?P<indent>[ \t]*)# \.\.\. \[pyfixer: lines (?P<start>\d+)-(?P<end>\d+) unchanged\]\s*$")
+
+
+class ElisionError(ValueError):
+    """
+    Raised when a fix leaves out elision markers that were in its prompt.
+    """
+
+
+def estimate_tokens(text):
+    """
+    Rough token count (about four characters per token), good enough for budgeting.
+    """
+    return (len(text or "") + 3) // 4
+
+
+def is_project_frame(filename):
+    """
+    True for frames in application code, False for stdlib, site-packages and <string> frames.
+    """
+    normalized = normalize_path(filename)
+    if normalized.startswith("<"):
+        return False
+    return not any(part in os.path.abspath(filename).split(os.sep) for part in ("site-packages", "dist-packages"))
+
+
+# --- Source slicing ---
+def _assigned_names(node):
+    names = set()
+    targets = []
+    if isinstance(node, ast.Assign):
+        targets = node.targets
+    elif isinstance(node, (ast.AugAssign, ast.AnnAssign)):
+        targets = [node.target]
+    elif isinstance(node, (ast.For, ast.AsyncFor)):
+        targets = [node.target]
+    elif isinstance(node, (ast.With, ast.AsyncWith)):
+        targets = [item.optional_vars for item in node.items if item.optional_vars is not None]
+    elif isinstance(node, (ast.Import, ast.ImportFrom)):
+        names.update((alias.asname or alias.name).split(".")[0] for alias in node.names)
+    for target in targets:
+        names.update(n.id for n in ast.walk(target) if isinstance(n, ast.Name))
+    for child in ast.walk(node):
+        if isinstance(child, ast.NamedExpr):
+            names.add(child.target.id)
+    return names
+
+
+def _loaded_names(node, lines):
+    # Names read by `node` on the given (function-relative) lines
+    return {n.id for n in ast.walk(node) if isinstance(n, ast.Name) and isinstance(n.ctx, ast.Load) and n.lineno in lines}
+
+
+def _statement_lines(node):
+    """
+    Lines that represent a statement in the slice: the header for compound statements, all lines otherwise.
+    """
+    body = getattr(node, "body", None)
+    if isinstance(body, list) and body and isinstance(body[0], ast.stmt):
+        if body[0].lineno > node.lineno:
+            return set(range(node.lineno, body[0].lineno))
+        return {node.lineno}
+    return set(range(node.lineno, (node.end_lineno or node.lineno) + 1))
+
+
+def _statements(node):
+    for child in ast.walk(node):
+        if isinstance(child, ast.stmt) and child is not node:
+            yield child
+
+
+def slice_function_source(source_lines, start_line, failing_line, code_budget_tokens=None):
+    """
+    Cuts a function's source down to the lines that matter for `failing_line` (a file line number).
+    `source_lines` are the function's lines as returned by inspect.getsourcelines, starting at `start_line`.
+    Returns the sliced text; the full source comes back unchanged when it already fits the budget
+    or cannot be parsed.
+    """
+    full_source = "".join(source_lines)
+    if code_budget_tokens is not None and estimate_tokens(full_source) <= code_budget_tokens:
+        return full_source
+    try:
+        tree = ast.parse(textwrap.dedent(full_source))
+    except SyntaxError:
+        return full_source
+    func = next((n for n in tree.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef))), None)
+    rel_failing = failing_line - start_line + 1
+    if func is None or not (1 <= rel_failing <= len(source_lines)):
+        return full_source
+
+    # Signature (with decorators) is always kept
+    required = set(range(1, func.body[0].lineno))
+
+    # Innermost statement on the failing line, plus headers of every enclosing block
+    failing_stmt = None
+    for stmt in _statements(func):
+        if stmt.lineno <= rel_failing <= (stmt.end_lineno or stmt.lineno):
+            span = (stmt.end_lineno or stmt.lineno) - stmt.lineno
+            if failing_stmt is None or span < (failing_stmt.end_lineno or failing_stmt.lineno) - failing_stmt.lineno:
+                failing_stmt = stmt
+    if failing_stmt is None:
+        return full_source
+    failing_lines = _statement_lines(failing_stmt)
+    for stmt in _statements(func):
+        if stmt is not failing_stmt and stmt.lineno < failing_stmt.lineno <= (stmt.end_lineno or stmt.lineno):
+            required |= _statement_lines(stmt)
+    required |= failing_lines
+
+    # Backward data flow: earlier statements that assign names the failing statement reads
+    earlier = [s for s in _statements(func) if (s.end_lineno or s.lineno) < failing_stmt.lineno]
+    pending = _loaded_names(failing_stmt, failing_lines)
+    seen_names = set()
+    flow = {}
+    while pending:
+        name = pending.pop()
+        seen_names.add(name)
+        for stmt in earlier:
+            if name in _assigned_names(stmt) and stmt.lineno not in flow:
+                lines = _statement_lines(stmt)
+                flow[stmt.lineno] = lines
+                pending |= _loaded_names(stmt, lines) - seen_names
+
+    keep = set(required)
+    # Closest data-flow lines first, skipping any that no longer fit the budget
+    for _, lines in sorted(flow.items(), key=lambda item: rel_failing - item[0]):
+        candidate = keep | lines
+        if code_budget_tokens is not None and estimate_tokens(_render(source_lines, start_line, candidate)) > code_budget_tokens:
+            continue
+        keep = candidate
+
+    return _render(source_lines, start_line, keep)
+
+
+def _render(source_lines, start_line, keep):
+    out = []
+    gap_start = None
+    for rel, line in enumerate(source_lines, 1):
+        if rel in keep:
+            if gap_start is not None:
+                out.append(_marker(source_lines, start_line, gap_start, rel - 1))
+                gap_start = None
+            out.append(line)
+        elif gap_start is None:
+            gap_start = rel
+    if gap_start is not None:
+        out.append(_marker(source_lines, start_line, gap_start, len(source_lines)))
+    return "".join(out)
+
+
+def _marker(source_lines, start_line, gap_start, gap_end):
+    # Indented like the least-indented omitted line, so expand_elided_lines() can re-align them
+    gap = [l for l in source_lines[gap_start - 1:gap_end] if l.strip()]
+    indent = min((l[:len(l) - len(l.lstrip())] for l in gap), key=len, default="")
+    marker = ELISION_MARKER.format(start=start_line + gap_start - 1, end=start_line + gap_end - 1)
+    return indent + marker + "\n"
+
+
+def elided_ranges(snippet):
+    """
+    Returns the (start, end) file line ranges of the elision markers in a sliced snippet.
+    """
+    matches = (_ELISION_RE.match(line) for line in (snippet or "").splitlines())
+    return [(int(m.group("start")), int(m.group("end"))) for m in matches if m]
+
+
+def expand_elided_lines(fix_code, source_lines, start_line, required=None):
+    """
+    Replaces elision markers the model copied into its fix with the original lines they stand for,
+    re-indented to where the marker sits in the fix. `required` are the elided_ranges() of the
+    prompt's snippet; raises ElisionError unless the fix still contains every one of them.
+    """
+    if required:
+        present = set(elided_ranges(fix_code))
+        missing = [r for r in required if r not in present]
+        if missing:
+            raise ElisionError("The fix left out the marker(s) for lines "
+                               + ", ".join(f"{start}-{end}" for start, end in missing)
+                               + ", so those original lines would be deleted.")
+    if not fix_code or "[pyfixer: lines" not in fix_code:
+        return fix_code
+    out = []
+    for line in fix_code.splitlines(keepends=True):
+        match = _ELISION_RE.match(line.rstrip("\r\n"))
+        if not match:
+            out.append(line)
+            continue
+        first = int(match.group("start")) - start_line
+        last = int(match.group("end")) - start_line
+        original = source_lines[max(first, 0):last + 1]
+        non_blank = [l for l in original if l.strip()]
+        if not non_blank:
+            out.extend(original)
+            continue
+        original_indent = min(len(l) - len(l.lstrip()) for l in non_blank)
+        shift = len(match.group("indent")) - original_indent
+        for orig in original:
+            if not orig.strip():
+                out.append(orig)
+            elif shift >= 0:
+                out.append(" " * shift + orig)
+            else:
+                out.append(orig[min(-shift, len(orig) - len(orig.lstrip())):])
+    return "".join(out)
+
+
+# --- Traceback compaction ---
+def compact_traceback(error_info, frames, max_callers=DEFAULT_MAX_CALLERS):
+    """
+    Keeps the failing project frame and up to `max_callers` project frames above it.
+    """
+    if not frames:
+        return error_info.get("traceback", "No traceback")
+    project_frames = [f for f in frames if is_project_frame(f.filename)] or list(frames)[-1:]
+    keep = project_frames[-(max_callers + 1):]
+    lines = ["Traceback (most recent call last, library frames omitted):"]
+    omitted = len(frames) - len(keep)
+    if omitted:
+        lines.append(f"  ... {omitted} frame(s) omitted")
+    for frame in keep:
+        lines.append(f'  File "{os.path.basename(frame.filename)}", line {frame.lineno}, in {frame.name}')
+        if frame.line:
+            lines.append(f"    {frame.line.strip()}")
+    lines.append(f"{error_info.get('type', 'Unknown')}: {error_info.get('message', '')}")
+    return "\n".join(lines) + "\n"
+
+
+def build_prompt_context(error_info, source_lines, start_line, failing_line, frames,
+                         token_budget=None, max_callers=DEFAULT_MAX_CALLERS):
+    """
+    Returns (code_snippet, traceback_text) sized to fit `token_budget` tokens of prompt.
+    """
+    token_budget = token_budget or DEFAULT_TOKEN_BUDGET
+    full_source = "".join(source_lines)
+    before = estimate_tokens(build_fix_prompt(error_info, full_source))
+
+    traceback_text = compact_traceback(error_info, frames, max_callers)
+    code_budget = max(token_budget - PROMPT_OVERHEAD_TOKENS - estimate_tokens(traceback_text)
+                      - estimate_tokens(error_info.get("locals")), 0)
+    if failing_line is not None and source_lines:
+        code_snippet = slice_function_source(source_lines, start_line, failing_line, code_budget)
+    else:
+        code_snippet = full_source
+
+    after = estimate_tokens(build_fix_prompt(dict(error_info, traceback=traceback_text), code_snippet))
+    log.info("Prompt size ~%d tokens -> ~%d tokens (budget %d).", before, after, token_budget)
+    return code_snippet, traceback_text
+
+
+# --- Fix requests ---
+# The traceback -> failing function -> prompt -> restored fix steps shared by the dialog,
+# the background queue, the headless thread path and the benchmark.
+def code_qualnames(exc_traceback):
+    """
+    Qualified names of the code objects in a traceback (co_qualname, Python 3.11+), one per frame.
+    """
+    return [getattr(frame.f_code, "co_qualname", frame.f_code.co_name) for frame, _ in traceback.walk_tb(exc_traceback)]
+
+
+def locate_failing_function(frames, qualnames=None):
+    """
+    Finds the innermost project frame that lies inside a function. `qualnames` (see code_qualnames)
+    tell same-named functions apart; without them the frame's plain function name is used.
+    Returns (file_index, span, frame position in `frames`), or None.
+    """
+    for position in range(len(frames) - 1, -1, -1):
+        frame = frames[position]
+        if not is_project_frame(frame.filename):
+            continue
+        name = qualnames[position] if qualnames is not None and position < len(qualnames) else frame.name
+        resolved = source_index.resolve(frame.filename, frame.lineno, name)
+        if resolved is not None:
+            return resolved[0], resolved[1], position
+        log.warning("Line %d of '%s' is not inside a function.", frame.lineno, frame.filename)
+    return None
+
+
+class FixPrompt:
+    """
+    The prompt for one failing function, plus what turns the model's answer back into a complete
+    fix: the elided line ranges and, for answers that drop their markers, a full-source prompt.
+    """
+
+    def __init__(self, prompt, source_lines=(), start_line=1, elided=(), full_prompt=None):
+        self.prompt = prompt
+        self.source_lines = list(source_lines)
+        self.start_line = start_line
+        self.elided = list(elided)
+        self.full_prompt = full_prompt
+
+    def restore(self, fix_code, required=None):
+        """
+        Puts back the lines the prompt showed only as elision markers. Raises ElisionError when the
+        fix leaves out any of `required` (default: every marker of the sliced prompt).
+        """
+        if fix_code == "NO_FIX_AVAILABLE" or not self.source_lines:
+            return fix_code
+        return expand_elided_lines(fix_code, self.source_lines, self.start_line,
+                                   self.elided if required is None else required)
+
+    def request(self, generate):
+        """
+        Returns the restored fix from `generate(prompt)` (a cleaned answer), asking once more with
+        the full function source when the first answer dropped elision markers. Only a prompt that
+        elided nothing has no full-source fallback, and its answers cannot drop a marker.
+        """
+        try:
+            return self.restore(generate(self.prompt))
+        except ElisionError as e:
+            if self.full_prompt is None:
+                raise
+            log.warning("%s Asking again with the full function source.", e)
+            return self.restore(generate(self.full_prompt), ())
+
+
+def prepare_fix_prompt(error_info, frames, source_lines=(), start_line=1, failing_line=None):
+    """
+    Builds the token-budgeted FixPrompt for the function `source_lines` (starting at file line
+    `start_line`); without source the model is told none is available.
+    """
+    if not source_lines:
+        return FixPrompt(build_fix_prompt(error_info, "Source not available."))
+    snippet, traceback_text = build_prompt_context(error_info, source_lines, start_line, failing_line, frames)
+    prompt_error_info = dict(error_info, traceback=traceback_text)
+    elided = elided_ranges(snippet)
+    full_prompt = build_fix_prompt(prompt_error_info, "".join(source_lines)) if elided else None
+    return FixPrompt(build_fix_prompt(prompt_error_info, snippet), source_lines, start_line, elided, full_prompt)
@@ -0,0 +1,187 @@
+import os
+import re
+import time
+import hashlib
+import sysconfig
+import threading
+import traceback
+from collections import OrderedDict
+
+# --- Traceback Fingerprinting and Clustering ---
+# Errors are grouped by a stable cluster id built from the exception type, the message with
+# volatile values stripped, and the innermost frames with paths normalized and line numbers
+# replaced by the source text of each line (so edits elsewhere in a file do not split a cluster).
+
+MAX_FINGERPRINT_FRAMES = 8
+
+_HEX_ADDRESS_RE = re.compile(r"0x[0-9a-fA-F]+")
+_UUID_RE = re.compile(r"\b[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}\b")
+_PATH_RE = re.compile(r"(?:[A-Za-z]:)?(?:[\\/][\w.\-]+){2,}")
+_QUOTED_RE = re.compile(r"'[^']*'|\"[^\"]*\"")
+_NUMBER_RE = re.compile(r"\b\d+(\.\d+)?\b")
+_TB_FRAME_RE = re.compile(r'^\s*File "(?P<filename>[^"]+)", line (?P<lineno>\d+), in (?P<name>.+)$')
+
+_STDLIB_DIRS = tuple(
+    os.path.normcase(os.path.abspath(p))
+    for p in {sysconfig.get_paths().get("stdlib"), sysconfig.get_paths().get("platstdlib")} if p
+)
+
+
+def normalize_error_message(message):
+    """
+    Strips volatile values (addresses, ids, paths, quoted literals, numbers) from an error message.
+    """
+    message = _HEX_ADDRESS_RE.sub("<addr>", message or "")
+    message = _UUID_RE.sub("<uuid>", message)
+    message = _PATH_RE.sub("<path>", message)
+    message = _QUOTED_RE.sub("<str>", message)
+    message = _NUMBER_RE.sub("<num>", message)
+    return " ".join(message.split())
+
+
+def normalize_path(filename, project_root=None):
+    """
+    Maps a frame filename to a machine-independent form: relative to the project root,
+    to site-packages, or to the stdlib; otherwise just the file name.
+    """
+    if not filename or filename.startswith("<"):
+        return filename or "<unknown>"
+    path = os.path.normcase(os.path.abspath(filename))
+    for marker in ("site-packages", "dist-packages"):
+        _, sep, rest = path.partition(os.sep + marker + os.sep)
+        if sep:
+            return rest.replace(os.sep, "/")
+    for stdlib_dir in _STDLIB_DIRS:
+        if path.startswith(stdlib_dir + os.sep):
+            return "<stdlib>/" + os.path.relpath(path, stdlib_dir).replace(os.sep, "/")
+    root = os.path.normcase(os.path.abspath(project_root or os.getcwd()))
+    if path.startswith(root + os.sep):
+        return os.path.relpath(path, root).replace(os.sep, "/")
+    return os.path.basename(path)
+
+
+def frame_key(frame, project_root=None):
+    """
+    Line-number independent key for one traceback.FrameSummary.
+    """
+    line = " ".join((frame.line or "").split())
+    return f"{normalize_path(frame.filename, project_root)}:{frame.name}:{line}"
+
+
+def frame_signature(frames, project_root=None, max_frames=MAX_FINGERPRINT_FRAMES):
+    """
+    Signature of the innermost `max_frames` frames from traceback.extract_tb().
+    """
+    return "|".join(frame_key(frame, project_root) for frame in list(frames)[-max_frames:])
+
+
+def fingerprint(error_type, message, frames, project_root=None):
+    """
+    Returns the stable cluster id for an error.
+    """
+    raw = "\n".join([error_type or "", normalize_error_message(message), frame_signature(frames, project_root)])
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()[:16]
+
+
+def parse_traceback_text(tb_text):
+    """
+    Rebuilds traceback.FrameSummary objects from a formatted traceback string.
+    """
+    frames = []
+    lines = (tb_text or "").splitlines()
+    for i, line in enumerate(lines):
+        match = _TB_FRAME_RE.match(line)
+        if not match:
+            continue
+        source_line = None
+        if i + 1 < len(lines) and not _TB_FRAME_RE.match(lines[i + 1]) and lines[i + 1].startswith("    "):
+            source_line = lines[i + 1].strip()
+        frames.append(traceback.FrameSummary(
+            match.group("filename"), int(match.group("lineno")), match.group("name").strip(),
+            lookup_line=False, line=source_line
+        ))
+    return frames
+
+
+class ErrorCluster:
+    """
+    One group of equivalent errors. Only the first occurrence is kept as a sample.
+    """
+    __slots__ = ("cluster_id", "error_type", "count", "first_seen", "last_seen", "sample", "decision")
+
+    def __init__(self, cluster_id, error_type, sample, now):
+        self.cluster_id = cluster_id
+        self.error_type = error_type
+        self.count = 0
+        self.first_seen = now
+        self.last_seen = now
+        self.sample = sample      # Representative error_info dict
+        self.decision = None      # Review outcome once someone has looked at this cluster
+
+    @property
+    def reviewed(self):
+        return self.decision is not None
+
+    def to_dict(self):
+        return {
+            "cluster_id": self.cluster_id,
+            "type": self.error_type,
+            "count": self.count,
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+            "decision": self.decision,
+            "sample": self.sample,
+        }
+
+
+class ClusterIndex:
+    """
+    Thread-safe in-memory index of error clusters. With `max_clusters` set, the least
+    recently seen cluster is dropped once the index is full.
+    """
+
+    def __init__(self, max_clusters=None, project_root=None):
+        self.max_clusters = max_clusters
+        self.project_root = project_root
+        self._clusters = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, error_type, message, frames, sample=None, now=None):
+        """
+        Records one occurrence. Returns (cluster, is_new).
+        """
+        cluster_id = fingerprint(error_type, message, frames, self.project_root)
+        now = time.time() if now is None else now
+        with self._lock:
+            cluster = self._clusters.get(cluster_id)
+            is_new = cluster is None
+            if is_new:
+                cluster = ErrorCluster(cluster_id, error_type, sample, now)
+                self._clusters[cluster_id] = cluster
+                if self.max_clusters and len(self._clusters) > self.max_clusters:
+                    self._clusters.popitem(last=False)
+            else:
+                self._clusters.move_to_end(cluster_id)
+            cluster.count += 1
+            cluster.last_seen = now
+        return cluster, is_new
+
+    def get(self, cluster_id):
+        with self._lock:
+            return self._clusters.get(cluster_id)
+
+    def record_decision(self, cluster_id, decision):
+        with self._lock:
+            cluster = self._clusters.get(cluster_id)
+            if cluster is not None:
+                cluster.decision = decision
+
+    def clusters(self):
+        with self._lock:
+            return list(self._clusters.values())
+
+    def __len__(self):
+        return len(self._clusters)
+
+    def __contains__(self, cluster_id):
+        return cluster_id in self._clusters
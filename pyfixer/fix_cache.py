@@ -0,0 +1,213 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+
+from . import tracing
+from .fingerprint import normalize_error_message
+
+# --- Persistent Fix-Suggestion Cache ---
+# Two tiers: a small in-memory LRU in front of an on-disk store (one JSON file per entry).
+# Entries are keyed on the error fingerprint plus a hash of the erroring function's source,
+# so an unchanged function hitting the same error never costs a second Gemini call.
+
+# Next to the pyfixer package, where it was before the modules moved into it
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".pyfixer_cache")
+DEFAULT_TTL_SECONDS = 7 * 24 * 60 * 60  # One week
+DEFAULT_MEMORY_ENTRIES = 128
+DEFAULT_DISK_ENTRIES = 2048
+
+log = tracing.get_logger("Cache")
+
+
+def make_cache_key(error_type, error_message, frame_sig, original_code_snippet):
+    """
+    Combines exception type, normalized message, frame signature and source hash into one key.
+    """
+    source_hash = hashlib.sha256((original_code_snippet or "").encode("utf-8")).hexdigest()
+    raw_key = "\n".join([error_type or "", normalize_error_message(error_message), frame_sig or "", source_hash])
+    return hashlib.sha256(raw_key.encode("utf-8")).hexdigest()
+
+
+class FixCache:
+    """
+    In-memory LRU backed by an on-disk store, with TTL and size based eviction.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 max_memory_entries=DEFAULT_MEMORY_ENTRIES, max_disk_entries=DEFAULT_DISK_ENTRIES):
+        self.cache_dir = cache_dir
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self._memory = OrderedDict()  # key -> entry dict
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # --- Lookup / Store ---
+    def get(self, key):
+        """
+        Returns the cached fix for `key`, or None on a miss or an expired entry.
+        """
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if self._is_expired(entry):
+                    del self._memory[key]
+                    self._delete_disk_entry(key)
+                else:
+                    self._memory.move_to_end(key)
+                    self.memory_hits += 1
+                    tracing.incr("cache_hits")
+                    return entry["fix"]
+
+            entry = self._read_disk_entry(key)
+            if entry is not None:
+                if self._is_expired(entry):
+                    self._delete_disk_entry(key)
+                else:
+                    self._remember(key, entry)
+                    self.disk_hits += 1
+                    tracing.incr("cache_hits")
+                    return entry["fix"]
+
+            self.misses += 1
+            tracing.incr("cache_misses")
+            return None
+
+    def put(self, key, fix, filepath=None, function_name=None):
+        """
+        Stores a fix under `key`. `filepath`/`function_name` are kept so the entry can be invalidated later.
+        """
+        entry = {
+            "fix": fix,
+            "created": time.time(),
+            "filepath": os.path.abspath(filepath) if filepath else None,
+            "function": function_name,
+        }
+        with self._lock:
+            self._remember(key, entry)
+            self._write_disk_entry(key, entry)
+            self._evict_disk()
+
+    def invalidate(self, key):
+        """
+        Drops the entry stored under `key` (e.g. a fix the user rejected). Returns True if one existed.
+        """
+        with self._lock:
+            in_memory = self._memory.pop(key, None) is not None
+            on_disk = os.path.exists(self._entry_path(key))
+            self._delete_disk_entry(key)
+        return in_memory or on_disk
+
+    def invalidate_function(self, filepath, function_name):
+        """
+        Drops every entry recorded for `function_name` in `filepath` (called after the function is rewritten).
+        """
+        filepath = os.path.abspath(filepath)
+        removed = 0
+        with self._lock:
+            for key in [k for k, e in self._memory.items() if self._matches(e, filepath, function_name)]:
+                del self._memory[key]
+            for key, entry in self._iter_disk_entries():
+                if self._matches(entry, filepath, function_name):
+                    self._delete_disk_entry(key)
+                    removed += 1
+        log.info("Invalidated %d cached fix(es) for '%s'.", removed, function_name)
+        return removed
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+            for key, _ in self._iter_disk_entries():
+                self._delete_disk_entry(key)
+
+    def stats(self):
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "memory_entries": len(self._memory),
+        }
+
+    # --- Internals ---
+    def _is_expired(self, entry):
+        return self.ttl_seconds is not None and time.time() - entry.get("created", 0) > self.ttl_seconds
+
+    @staticmethod
+    def _matches(entry, filepath, function_name):
+        return entry.get("filepath") == filepath and entry.get("function") == function_name
+
+    def _remember(self, key, entry):
+        self._memory[key] = entry
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+            self.evictions += 1
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def _read_disk_entry(self, key):
+        try:
+            with open(self._entry_path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _write_disk_entry(self, key, entry):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = self._entry_path(key) + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, self._entry_path(key))
+        except OSError as e:
+            log.warning("Could not write cache entry: %s", e)
+
+    def _delete_disk_entry(self, key):
+        try:
+            os.remove(self._entry_path(key))
+        except OSError:
+            pass
+
+    def _iter_disk_entries(self):
+        try:
+            names = os.listdir(self.cache_dir)
+        except OSError:
+            return
+        for name in names:
+            if name.endswith(".json"):
+                key = name[:-len(".json")]
+                entry = self._read_disk_entry(key)
+                if entry is not None:
+                    yield key, entry
+
+    def _evict_disk(self):
+        try:
+            paths = [os.path.join(self.cache_dir, n) for n in os.listdir(self.cache_dir) if n.endswith(".json")]
+        except OSError:
+            return
+        if len(paths) <= self.max_disk_entries:
+            return
+        ages = []
+        for path in paths:
+            try:
+                ages.append((os.path.getmtime(path), path))
+            except OSError:
+                pass  # Removed by another process in the meantime
+        if len(ages) <= self.max_disk_entries:
+            return
+        ages.sort()
+        for _, path in ages[:len(ages) - self.max_disk_entries]:
+            try:
+                os.remove(path)
+                self.evictions += 1
+            except OSError:
+                pass
@@ -0,0 +1,200 @@
+import os
+import ast
+import time
+import difflib
+import textwrap
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from . import tracing
+from .gemini_fix import clean_fix_response
+from .context_builder import estimate_tokens
+
+# --- Speculative Multi-Candidate Generation ---
+# Model latency varies a lot from call to call, so instead of waiting on one request we can send
+# several at once (different temperatures) and take the first answer that passes a cheap static
+# check: it parses, keeps the function's signature and changes only a small part of it.
+# The remaining requests are abandoned; streaming backends stop reading and drop the connection.
+# Duplicate answers (same normalized AST) count once.
+# Off by default: every extra candidate is another full model request, and only a single
+# request streams into the fix pane as it arrives. Enable with PYFIXER_CANDIDATES=3.
+
+DEFAULT_CANDIDATES = int(os.environ.get("PYFIXER_CANDIDATES", "1"))
+# Used for the extra candidates; the first one keeps the configured temperature (PYFIXER_TEMPERATURE)
+CANDIDATE_TEMPERATURES = (0.0, 0.4, 0.8, 1.0, 0.2, 0.6)
+
+# A fix qualifies when it rewrites at most this share of the original lines (or MIN_DIFF_LINES)
+MAX_DIFF_FRACTION = 0.5
+MIN_DIFF_LINES = 6
+
+log = tracing.get_logger("Candidates")
+
+
+class FixCandidate:
+    """
+    One model answer and the result of its static check.
+    """
+    __slots__ = ("code", "temperature", "elapsed", "normalized", "qualifies", "changed_lines", "reason")
+
+    def __init__(self, code, temperature, elapsed):
+        self.code = code
+        self.temperature = temperature
+        self.elapsed = elapsed
+        self.normalized = None      # ast.dump of the parsed fix, used to drop duplicates
+        self.qualifies = False
+        self.changed_lines = None
+        self.reason = ""
+
+    def rank_key(self):
+        # Qualifying first, then the smallest change, then the earliest answer
+        return (not self.qualifies, self.changed_lines if self.changed_lines is not None else float("inf"), self.elapsed)
+
+    def __repr__(self):
+        return f"FixCandidate(t={self.temperature}, qualifies={self.qualifies}, changed={self.changed_lines}, {self.reason!r})"
+
+
+def _parse(code):
+    try:
+        return ast.parse(textwrap.dedent(code))
+    except (SyntaxError, ValueError):
+        return None
+
+
+def _single_function(tree):
+    # The one top-level def, optionally preceded by the imports it needs
+    if tree is None:
+        return None
+    defs = [n for n in tree.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef))]
+    others = [n for n in tree.body if not isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Import, ast.ImportFrom))]
+    if len(defs) == 1 and not others:
+        return defs[0]
+    return None
+
+
+def _changed_lines(before, after):
+    matcher = difflib.SequenceMatcher(None, before, after, autojunk=False)
+    return sum(max(i2 - i1, j2 - j1) for tag, i1, i2, j1, j2 in matcher.get_opcodes() if tag != "equal")
+
+
+def check_candidate(candidate, original_source):
+    """
+    Fills in `candidate`'s static check against the original function source.
+    """
+    code = candidate.code
+    if not code or code == "NO_FIX_AVAILABLE":
+        candidate.reason = "no fix"
+        return candidate
+    tree = _parse(code)
+    if tree is None:
+        candidate.reason = "does not parse"
+        return candidate
+    candidate.normalized = ast.dump(tree)
+
+    original_func = _single_function(_parse(original_source or ""))
+    if original_func is None:
+        # Nothing to compare against; parsing is all we can check
+        candidate.qualifies = True
+        candidate.reason = "parses"
+        return candidate
+
+    original_lines = textwrap.dedent(original_source).strip("\n").splitlines()
+    fixed_lines = textwrap.dedent(code).strip("\n").splitlines()
+    fixed_func = _single_function(tree)
+    if fixed_func is None and any(isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef)) and n.name == original_func.name
+                                  for n in tree.body):
+        # Would be nested inside the original function as a body
+        candidate.reason = "definition mixed with other statements"
+        return candidate
+    if fixed_func is not None:
+        if fixed_func.name != original_func.name or ast.dump(fixed_func.args) != ast.dump(original_func.args):
+            candidate.reason = "signature changed"
+            return candidate
+    else:
+        # Body-only answer: compare with the original body
+        original_lines = textwrap.dedent("\n".join(original_lines[original_func.body[0].lineno - 1:])).splitlines()
+
+    candidate.changed_lines = _changed_lines([l.strip() for l in original_lines], [l.strip() for l in fixed_lines])
+    limit = max(MIN_DIFF_LINES, int(len(original_lines) * MAX_DIFF_FRACTION))
+    if candidate.changed_lines > limit:
+        candidate.reason = f"changes {candidate.changed_lines} lines (limit {limit})"
+        return candidate
+    candidate.qualifies = True
+    candidate.reason = f"changes {candidate.changed_lines} lines"
+    return candidate
+
+
+def candidate_temperatures(n, configured=None):
+    """
+    Temperatures for `n` concurrent requests: `configured` (None means the backend's default)
+    for the first, then CANDIDATE_TEMPERATURES for the rest.
+    """
+    spread = [t for t in CANDIDATE_TEMPERATURES if t != configured]
+    return [configured] + [spread[i % len(spread)] for i in range(n - 1)]
+
+
+def generate_fix_candidates(prompt, original_source, backend, n=None, temperatures=None,
+                            prepare=None, is_cancelled=None):
+    """
+    Sends `prompt` to `backend` `n` times concurrently and returns (best FixCandidate or None,
+    all checked candidates). Returns as soon as one candidate qualifies; the others are abandoned.
+    `temperatures` defaults to candidate_temperatures() around the backend's configured temperature.
+    `prepare` maps a cleaned answer to the code to check (e.g. expanding elision markers).
+    `is_cancelled` is polled while answers stream in.
+    """
+    n = max(1, n or DEFAULT_CANDIDATES)
+    if temperatures is None:
+        temperatures = candidate_temperatures(n, getattr(getattr(backend, "config", None), "temperature", None))
+    stop = threading.Event()
+    started = time.perf_counter()
+
+    def request(temperature):
+        chunks = []
+        tracing.incr("api_calls")
+        tracing.incr("tokens_sent", estimate_tokens(prompt))
+        with tracing.span("api", temperature=temperature, speculative=True) as api_span:
+            stream = backend.stream(prompt, temperature=temperature)
+            try:
+                for text in stream:
+                    if stop.is_set() or (is_cancelled and is_cancelled()):
+                        api_span.set(abandoned=True)
+                        return None
+                    chunks.append(text)
+            finally:
+                stream.close()
+        code = clean_fix_response("".join(chunks))
+        if prepare and code != "NO_FIX_AVAILABLE":
+            code = prepare(code)
+        return check_candidate(FixCandidate(code, temperature, time.perf_counter() - started), original_source)
+
+    pool = ThreadPoolExecutor(max_workers=n, thread_name_prefix="pyfixer-candidate")
+    futures = [pool.submit(request, temperatures[i % len(temperatures)]) for i in range(n)]
+    candidates, seen, best = [], set(), None
+    try:
+        for future in as_completed(futures):
+            try:
+                candidate = future.result()
+            except Exception as e:
+                log.warning("Request failed: %s", e)
+                continue
+            if candidate is None:
+                continue
+            if candidate.normalized is not None and candidate.normalized in seen:
+                continue  # Same fix as an earlier answer, only formatted differently
+            if candidate.normalized is not None:
+                seen.add(candidate.normalized)
+            candidates.append(candidate)
+            if candidate.qualifies:
+                best = candidate
+                break
+    finally:
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    if best is None and candidates:
+        best = min(candidates, key=FixCandidate.rank_key)
+        if best.normalized is None:
+            best = None
+    if best is not None:
+        log.info("Picked candidate (temperature %s, %s) after %.2fs; %d of %d answer(s) checked.",
+                 best.temperature, best.reason, best.elapsed, len(candidates), n)
+    return best, candidates
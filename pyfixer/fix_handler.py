@@ -0,0 +1,769 @@
+import sys
+import atexit
+import traceback
+import os
+import inspect
+import time
+from datetime import datetime
+
+# Import PyQt6 modules
+from PyQt6.QtWidgets import (
+    QApplication, QDialog, QVBoxLayout, QHBoxLayout, QLabel, QTextEdit,
+    QPushButton, QMessageBox, QScrollArea, QSizePolicy
+)
+from PyQt6.QtCore import Qt, QTimer, QThread, pyqtSignal
+from PyQt6.QtGui import QFont, QTextCursor
+
+from .fingerprint import ClusterIndex, frame_signature
+from .fix_cache import FixCache
+from .gemini_fix import build_fix_prompt, clean_fix_response, fix_cache_key
+from .model_backend import get_backend
+from .patch_engine import apply_function_fixes, PatchError
+from .context_builder import (
+    code_qualnames, estimate_tokens, is_project_frame, locate_failing_function, prepare_fix_prompt, ElisionError
+)
+from .fix_verifier import verify_fix, verify_candidates
+from .frame_snapshot import capture_snapshot
+from .hot_patch import hot_patch_function, retry_call, DEFAULT_HOT_RELOAD, DEFAULT_RETRY
+from .fix_candidates import generate_fix_candidates, FixCandidate, DEFAULT_CANDIDATES
+from . import tracing
+
+# --- Interactive Error Fixing (Qt) ---
+# Loaded by the pyfixer package only when an error actually reaches one of its hooks, so applications
+# that install the hook never pay for PyQt6, the model SDK or credential checks at startup.
+
+log = tracing.get_logger("Handler")
+gemini_log = tracing.get_logger("Gemini")
+ui_log = tracing.get_logger("UI")
+patch_log = tracing.get_logger("Patcher")
+
+# --- 1. Fix Suggestion Cache ---
+# Shared across calls so repeated errors in an unchanged function are answered without Gemini.
+fix_cache = FixCache()
+
+# Occurrences of the same error (by traceback fingerprint) share one cluster, one Gemini call and one review.
+error_clusters = ClusterIndex(max_clusters=1024)
+
+# --- 2. Gemini Error Fixing Logic ---
+# Workers that were still running when their dialog closed. Qt aborts the process if a running
+# QThread is destroyed, so each stays referenced here until its finished signal is delivered.
+_running_workers = {}
+
+def keep_until_finished(worker):
+    """
+    Keeps `worker` (a QThread) alive after its owner lets go of it, until it has finished.
+    """
+    if worker is None or not worker.isRunning():
+        return
+    key = id(worker)
+    _running_workers[key] = worker
+    # Queued, so the last reference is dropped on the main thread rather than inside the worker
+    worker.finished.connect(lambda: _running_workers.pop(key, None), Qt.ConnectionType.QueuedConnection)
+    if worker.isFinished():
+        _running_workers.pop(key, None)
+
+def _wait_for_workers():
+    # At exit there is no event loop to deliver `finished`; cancelled workers stop after their
+    # current model chunk (bounded by the backend's request timeout)
+    for worker in list(_running_workers.values()):
+        worker.wait()
+    _running_workers.clear()
+
+atexit.register(_wait_for_workers)
+
+class GeminiFixWorker(QThread):
+    """
+    Streams a fix suggestion from Gemini on a background thread so the confirmation UI
+    can open immediately and render the answer chunk by chunk.
+    With more than one candidate, the answers are requested speculatively and the
+    first qualifying fix is shown in one piece instead.
+    """
+    chunk_received = pyqtSignal(str)  # Raw text as it arrives
+    stream_restarted = pyqtSignal()   # Text received so far was discarded; a new answer follows
+    fix_ready = pyqtSignal(str)       # Cleaned final fix with elided lines restored, or "NO_FIX_AVAILABLE"
+    failed = pyqtSignal(str)          # Error message from the API call
+
+    def __init__(self, error_info, original_code_snippet, filepath=None, function_name=None, prompt=None,
+                 candidates=None, prepare=None, elided=None, full_prompt=None, parent=None):
+        super().__init__(parent)
+        self.error_info = error_info
+        self.original_code_snippet = original_code_snippet
+        self.prompt = prompt or build_fix_prompt(error_info, original_code_snippet)
+        self.filepath = filepath
+        self.function_name = function_name
+        self.candidates = candidates or DEFAULT_CANDIDATES
+        # prepare(fix, required ranges) restores elided lines; raises ElisionError (see context_builder)
+        self.prepare = prepare
+        self.elided = list(elided or [])  # Line ranges the prompt shows only as elision markers
+        self.full_prompt = full_prompt    # Asked instead when the answer drops one of those markers
+        self.alternatives = []  # Runner-up candidates that parsed, best first (verified alongside the fix)
+        self.time_to_first_chunk = None
+        self.total_time = None
+
+    def cancel(self):
+        """
+        Stops consuming the stream. The chunk being received is dropped and no fix is produced.
+        """
+        gemini_log.info("Cancellation requested.")
+        self.requestInterruption()
+
+    def restore(self, fix_code, required=None):
+        if fix_code == "NO_FIX_AVAILABLE" or self.prepare is None:
+            return fix_code
+        return self.prepare(fix_code, self.elided if required is None else required)
+
+    def run(self):
+        started = time.perf_counter()
+        cache_key = fix_cache_key(self.error_info, self.original_code_snippet)
+        cached_fix = fix_cache.get(cache_key)
+        if cached_fix is not None:
+            self.time_to_first_chunk = self.total_time = time.perf_counter() - started
+            gemini_log.info("Cache hit, reusing previous fix. Stats: %s", fix_cache.stats())
+            self.fix_ready.emit(self.restore(cached_fix, ()))
+            return
+
+        try:
+            fix_code = self.request(started)
+        except ElisionError as e:
+            if self.full_prompt is None:
+                gemini_log.warning("Discarding fix: %s", e)
+                self.failed.emit(str(e))
+                self.fix_ready.emit("NO_FIX_AVAILABLE")
+                return
+            gemini_log.warning("%s Asking again with the full function source.", e)
+            self.prompt, self.elided, self.full_prompt = self.full_prompt, [], None
+            self.stream_restarted.emit()
+            fix_code = self.request(started)
+        if fix_code is None:
+            return  # Cancelled or failed; already reported
+
+        if fix_code != "NO_FIX_AVAILABLE" and not self.isInterruptionRequested():
+            fix_cache.put(cache_key, fix_code, filepath=self.filepath, function_name=self.function_name)
+        self.fix_ready.emit(fix_code)
+
+    def request(self, started):
+        """
+        Asks the model for one fix with the current prompt. Returns the restored fix,
+        "NO_FIX_AVAILABLE", or None after reporting a cancellation or failure.
+        """
+        if self.candidates > 1:
+            return self.request_candidates(started)
+
+        received = []
+        tracing.incr("api_calls")
+        tracing.incr("tokens_sent", estimate_tokens(self.prompt))
+        try:
+            gemini_log.info("Streaming prompt to Gemini API...")
+            with tracing.span("api", function=self.function_name, streaming=True) as api_span:
+                stream = get_backend().stream(self.prompt)
+                for text in stream:
+                    if self.isInterruptionRequested():
+                        gemini_log.info("Stream cancelled by user.")
+                        api_span.set(cancelled=True)
+                        stream.close()
+                        self.fix_ready.emit("NO_FIX_AVAILABLE")
+                        return None
+                    if not text:
+                        continue
+                    if self.time_to_first_chunk is None:
+                        self.time_to_first_chunk = time.perf_counter() - started
+                        api_span.set(first_chunk_ms=round(self.time_to_first_chunk * 1000, 1))
+                        gemini_log.info("First chunk after %.2fs.", self.time_to_first_chunk)
+                    received.append(text)
+                    self.chunk_received.emit(text)
+        except Exception as e:
+            gemini_log.error("Error calling Gemini API: %s", e)
+            self.failed.emit(str(e))
+            self.fix_ready.emit("NO_FIX_AVAILABLE")
+            return None
+
+        self.total_time = time.perf_counter() - started
+        gemini_log.info("Stream complete after %.2fs.", self.total_time)
+        return self.restore(clean_fix_response("".join(received)))
+
+    def request_candidates(self, started):
+        dropped_markers = []
+
+        def prepare(code):
+            try:
+                return self.restore(code)
+            except ElisionError as e:
+                dropped_markers.append(e)
+                raise
+
+        try:
+            gemini_log.info("Requesting %d candidate fixes from Gemini API...", self.candidates)
+            best, candidates = generate_fix_candidates(
+                self.prompt, self.original_code_snippet, get_backend(), n=self.candidates,
+                prepare=prepare, is_cancelled=self.isInterruptionRequested
+            )
+        except Exception as e:
+            gemini_log.error("Error calling Gemini API: %s", e)
+            self.failed.emit(str(e))
+            self.fix_ready.emit("NO_FIX_AVAILABLE")
+            return None
+
+        self.time_to_first_chunk = self.total_time = time.perf_counter() - started
+        if self.isInterruptionRequested():
+            self.fix_ready.emit("NO_FIX_AVAILABLE")
+            return None
+        if best is None:
+            if dropped_markers:
+                raise dropped_markers[0]
+            return "NO_FIX_AVAILABLE"
+        self.alternatives = [c.code for c in sorted(candidates, key=FixCandidate.rank_key)
+                             if c is not best and c.normalized is not None]
+        self.chunk_received.emit(best.code)
+        return best.code
+
+class FixVerificationWorker(QThread):
+    """
+    Verifies the final fix in a sandboxed child process (see fix_verifier.py) while the
+    dialog stays responsive, then reports the VerificationResult. Runner-up candidates are
+    verified in parallel with it; if the fix fails and one of them passes, that one is offered instead.
+    """
+    verified = pyqtSignal(object)       # VerificationResult of the fix on offer
+    replaced = pyqtSignal(str, object)  # Passing runner-up, and the failed result of the original fix
+
+    def __init__(self, filepath, function_name, call_args=None, error_type=None, parent=None):
+        super().__init__(parent)
+        self.filepath = filepath
+        self.function_name = function_name
+        self.call_args = call_args
+        self.error_type = error_type
+        self.fix_code = None
+        self.alternatives = []
+        self.result = None
+
+    def verify(self, fix_code, alternatives=()):
+        """
+        Starts verifying `fix_code`. Returns False when there is nothing to verify (no fix, unknown
+        source file) or a verification is already running.
+        """
+        if fix_code == "NO_FIX_AVAILABLE" or not fix_code.strip() or not self.filepath or self.isRunning():
+            return False
+        self.fix_code = fix_code
+        self.alternatives = list(alternatives)
+        self.start()
+        return True
+
+    def run(self):
+        log.info("Verifying fix for '%s'...", self.function_name)
+        with tracing.span("verify", function=self.function_name, candidates=1 + len(self.alternatives)) as verify_span:
+            if self.alternatives:
+                results = verify_candidates([self.fix_code] + self.alternatives, self.filepath,
+                                            self.function_name, self.call_args, self.error_type)
+            else:
+                results = [verify_fix(self.fix_code, self.filepath, self.function_name, self.call_args, self.error_type)]
+            self.result = results[0]
+            if not self.result.passed:
+                passing = next((i for i, r in enumerate(results) if r.passed), None)
+                if passing is not None:
+                    log.info("Suggested fix failed verification (%s); offering a runner-up that passed.", self.result.status)
+                    self.replaced.emit(self.alternatives[passing - 1], self.result)
+                    self.fix_code, self.result = self.alternatives[passing - 1], results[passing]
+            verify_span.set(status=self.result.status)
+        tracing.incr("fixes_verified" if self.result.passed else "fixes_failed_verification")
+        log.info("Verification %s after %.2fs.", self.result.status, self.result.elapsed)
+        self.verified.emit(self.result)
+
+# --- 3. PyQt6 UI for Confirmation ---
+# Seconds before an unanswered confirmation dialog closes itself (0 or unset waits forever).
+UI_TIMEOUT_SECONDS = float(os.environ.get("PYFIXER_UI_TIMEOUT", "0") or 0)
+
+class ErrorFixConfirmationUI(QDialog):
+    # Possible outcomes reported by get_result()
+    RESULT_PENDING = "pending"
+    RESULT_ACCEPTED = "accepted"
+    RESULT_REJECTED = "rejected"
+    RESULT_CLOSED = "closed"
+    RESULT_TIMED_OUT = "timed_out"
+
+    def __init__(self, error_info, original_code, suggested_fix=None, timeout_seconds=None):
+        # suggested_fix=None means the fix is still streaming in; see attach_worker().
+        super().__init__()
+        ui_log.debug("ErrorFixConfirmationUI __init__ started (PyQt).")
+        self.error_info = error_info
+        self.original_code = original_code
+        self.suggested_fix = suggested_fix
+        self.fix_accepted = False
+        self.result_state = self.RESULT_PENDING
+        self.timeout_seconds = UI_TIMEOUT_SECONDS if timeout_seconds is None else timeout_seconds
+
+        self.setWindowTitle("Application Error Detected! - Gemini Fix Suggestion")
+        self.setGeometry(100, 100, 900, 700) # x, y, width, height
+        self.setModal(True)
+
+        self.worker = None
+        self.verifier = None
+        self.verification = None  # VerificationResult for the suggested fix, once available
+        self.replaced_result = None  # Failed result of the first fix when a runner-up replaced it
+        self._received_first_chunk = False
+
+        self.setup_ui()
+
+        # Single-shot timer for the optional auto-timeout; it costs nothing while idle.
+        self._timeout_timer = QTimer(self)
+        self._timeout_timer.setSingleShot(True)
+        self._timeout_timer.timeout.connect(self.timeout_fix)
+
+    def run(self):
+        """
+        Shows the dialog and blocks on a nested Qt event loop until the user decides
+        (or the auto-timeout fires). The loop sleeps between events, so waiting is idle.
+        Returns one of the RESULT_* values.
+        """
+        if self.timeout_seconds and self.timeout_seconds > 0:
+            self._timeout_timer.start(int(self.timeout_seconds * 1000))
+        self.raise_() # Bring to front
+        self.activateWindow() # Activate the window
+        self.exec()
+        self._timeout_timer.stop()
+        self.stop_worker()
+        return self.result_state
+
+    def stop_worker(self):
+        # A decision was made while the fix may still be streaming; stop consuming it. The worker
+        # is usually still blocked on the model, so it is kept alive until it notices.
+        if self.worker is not None and self.worker.isRunning():
+            self.worker.cancel()
+            keep_until_finished(self.worker)
+        # Verification can outlive the dialog as well (up to PYFIXER_VERIFY_TIMEOUT)
+        keep_until_finished(self.verifier)
+
+    def setup_ui(self):
+        main_layout = QVBoxLayout()
+        self.setLayout(main_layout)
+
+        # Set a monospaced font for code displays
+        code_font = QFont("Consolas", 10)
+        # Fallback fonts for other OS if Consolas isn't available
+        if sys.platform == "darwin": # macOS
+             code_font = QFont("Monaco", 10)
+        elif sys.platform == "linux": # Linux
+             code_font = QFont("DejaVu Sans Mono", 10)
+
+        # Error Details
+        main_layout.addWidget(QLabel("<b>Error Details:</b>"))
+        error_text_edit = QTextEdit()
+        error_text_edit.setReadOnly(True)
+        error_text_edit.setText(
+            f"Type: {self.error_info.get('type', 'N/A')}\n"
+            f"Message: {self.error_info.get('message', 'N/A')}\n\n"
+            f"Traceback:\n{self.error_info.get('traceback', 'N/A')}"
+            + (f"\nLocal Values:\n{self.error_info['locals']}" if self.error_info.get('locals') else "")
+        )
+        error_text_edit.setFont(code_font)
+        error_text_edit.setFixedHeight(120) # Fixed height for error details
+        main_layout.addWidget(error_text_edit)
+
+        # Original Code
+        main_layout.addWidget(QLabel("<b>Original Code Snippet (from the erroring function):</b>"))
+        original_code_text_edit = QTextEdit()
+        original_code_text_edit.setReadOnly(True)
+        original_code_text_edit.setText(self.original_code)
+        original_code_text_edit.setFont(code_font)
+        original_code_text_edit.setFixedHeight(180) # Fixed height for original code
+        main_layout.addWidget(original_code_text_edit)
+
+        # Suggested Fix
+        main_layout.addWidget(QLabel("<b>Gemini Suggested Fix:</b>"))
+        self.suggested_fix_text_edit = QTextEdit()
+        self.suggested_fix_text_edit.setReadOnly(True)
+        self.suggested_fix_text_edit.setFont(code_font)
+        self.suggested_fix_text_edit.setFixedHeight(180) # Fixed height for suggested fix
+        main_layout.addWidget(self.suggested_fix_text_edit)
+
+        # Result of replaying the failing call against the fix (see FixVerificationWorker)
+        self.verification_label = QLabel("")
+        self.verification_label.setWordWrap(True)
+        main_layout.addWidget(self.verification_label)
+
+        # Buttons
+        button_layout = QHBoxLayout()
+        main_layout.addLayout(button_layout)
+
+        self.accept_button = QPushButton("Accept Fix and Save")
+        self.accept_button.clicked.connect(self.accept_fix)
+        button_layout.addWidget(self.accept_button)
+
+        self.reject_button = QPushButton("Reject Fix (Continue with Error)")
+        self.reject_button.clicked.connect(self.reject_fix)
+        button_layout.addWidget(self.reject_button)
+
+        self.cancel_request_button = QPushButton("Cancel Gemini Request")
+        self.cancel_request_button.clicked.connect(self.cancel_request)
+        button_layout.addWidget(self.cancel_request_button)
+
+        if self.suggested_fix is None:
+            self.suggested_fix_text_edit.setPlaceholderText("Waiting for Gemini...")
+            self.accept_button.setEnabled(False)
+            self.accept_button.setText("Waiting for Fix...")
+        else:
+            self.set_final_fix(self.suggested_fix)
+
+    # --- Streaming updates from GeminiFixWorker ---
+    def attach_worker(self, worker):
+        """
+        Wires a GeminiFixWorker to this dialog so its output renders live in the fix pane.
+        """
+        self.worker = worker
+        worker.chunk_received.connect(self.append_fix_chunk)
+        worker.stream_restarted.connect(self.restart_fix_stream)
+        worker.fix_ready.connect(self.set_final_fix)
+        worker.failed.connect(self.show_fix_error)
+
+    def attach_verifier(self, verifier):
+        """
+        Verifies each final fix with `verifier` and shows the outcome under the fix pane.
+        """
+        self.verifier = verifier
+        verifier.verified.connect(self.show_verification)
+        verifier.replaced.connect(self.replace_fix)
+        if self.worker is not None:
+            self.worker.fix_ready.connect(self.start_verification)
+        elif self.suggested_fix:
+            self.start_verification(self.suggested_fix)
+
+    def start_verification(self, fix):
+        if self.result_state != self.RESULT_PENDING:
+            return
+        if self.verifier.verify(fix, self.worker.alternatives if self.worker is not None else ()):
+            self.verification_label.setText("<b>Verification:</b> running...")
+
+    def replace_fix(self, fix, failed_result):
+        self.replaced_result = failed_result
+        self.suggested_fix = fix
+        self.suggested_fix_text_edit.setText(fix)
+
+    def show_verification(self, result):
+        self.verification = result
+        color = "green" if result.passed else "red"
+        text = f"<b>Verification:</b> <span style='color:{color}'>{result.summary()}</span>"
+        if self.replaced_result is not None:
+            text += f"<br>Showing another candidate; the first suggestion failed: {self.replaced_result.summary()}"
+        self.verification_label.setText(text.replace("\n", "<br>"))
+
+    def append_fix_chunk(self, text):
+        if not self._received_first_chunk:
+            self._received_first_chunk = True
+            self.suggested_fix_text_edit.clear()
+        cursor = self.suggested_fix_text_edit.textCursor()
+        cursor.movePosition(QTextCursor.MoveOperation.End)
+        cursor.insertText(text)
+        self.suggested_fix_text_edit.setTextCursor(cursor)
+
+    def restart_fix_stream(self):
+        self._received_first_chunk = False
+        self.suggested_fix_text_edit.clear()
+        self.suggested_fix_text_edit.setPlaceholderText("The answer left out unchanged lines; asking Gemini again with the full function...")
+
+    def set_final_fix(self, fix):
+        self.suggested_fix = fix
+        self.cancel_request_button.setEnabled(False)
+        if fix == "NO_FIX_AVAILABLE" or not fix.strip():
+            self.suggested_fix_text_edit.setText("Gemini could not provide a fix for this error or the fix was empty.")
+            self.accept_button.setEnabled(False)
+            self.accept_button.setText("No Fix Available")
+        else:
+            self.suggested_fix_text_edit.setText(fix) # Replace the raw stream with the fence-stripped fix
+            self.accept_button.setEnabled(True)
+            self.accept_button.setText("Accept Fix and Save")
+            self.verification_label.setText("<b>Verification:</b> not verified")
+
+    def show_fix_error(self, message):
+        QMessageBox.critical(self, "Gemini API Error", f"Failed to get fix from Gemini: {message}")
+
+    def cancel_request(self):
+        if self.worker is not None and self.worker.isRunning():
+            self.worker.cancel()
+        self.cancel_request_button.setEnabled(False)
+        self.suggested_fix_text_edit.setPlaceholderText("Gemini request cancelled.")
+
+    def accept_fix(self):
+        self.fix_accepted = True
+        self.result_state = self.RESULT_ACCEPTED
+        QMessageBox.information(self, "Fix Accepted", "The suggested fix has been accepted. Attempting to save to file.")
+        ui_log.info("accept_fix called. Closing UI (PyQt).")
+        self.accept() # Ends the dialog's event loop
+
+    def reject_fix(self):
+        self.fix_accepted = False
+        self.result_state = self.RESULT_REJECTED
+        QMessageBox.warning(self, "Fix Rejected", "The suggested fix has been rejected. The application will continue without applying the fix.")
+        ui_log.info("reject_fix called. Closing UI (PyQt).")
+        self.reject() # Ends the dialog's event loop
+
+    def timeout_fix(self):
+        if self.result_state != self.RESULT_PENDING:
+            return
+        self.fix_accepted = False
+        self.result_state = self.RESULT_TIMED_OUT
+        ui_log.info("No decision after %ss. Closing UI (PyQt).", self.timeout_seconds)
+        self.reject()
+
+    def reject(self):
+        # QDialog routes Escape here as well; treat it like closing the window.
+        if self.result_state == self.RESULT_PENDING:
+            self.fix_accepted = False
+            self.result_state = self.RESULT_CLOSED
+            QMessageBox.warning(self, "Fix Not Applied", "Window closed without accepting fix. Fix not applied.")
+            ui_log.info("Dialog dismissed. Fix was not accepted. Closing UI (PyQt).")
+        super().reject()
+
+    def closeEvent(self, event):
+        # Called when the window is closed with 'X'. Accept/reject have already set the result,
+        # so only an undecided dialog is recorded as closed.
+        if self.result_state == self.RESULT_PENDING:
+            self.reject()
+        ui_log.debug("closeEvent called. Result: %s (PyQt).", self.result_state)
+        event.accept() # Accept the close event, allowing the window to close
+
+    def get_result(self):
+        return self.result_state
+
+    def get_user_decision(self):
+        return self.fix_accepted
+
+# --- 4. Code Patching Logic ---
+def apply_function_code_fix(filepath, target_function_name, new_code_snippet):
+    """
+    Replaces `target_function_name` (a plain or qualified name, including methods,
+    async and nested functions) in `filepath` with the suggested fix.
+    See patch_engine.apply_function_fixes for how the fix is spliced in.
+    """
+    patch_log.info("Applying fix to: %s for function '%s'", filepath, target_function_name)
+    try:
+        with tracing.span("patch", function=target_function_name):
+            apply_function_fixes(filepath, {target_function_name: new_code_snippet}, note_lines=_fix_note_lines())
+        tracing.incr("fixes_applied")
+        patch_log.info("Code successfully written to %s.", filepath)
+        # The function body changed, so any fix cached against the old body is stale.
+        fix_cache.invalidate_function(filepath, target_function_name)
+        return True
+    except PatchError as e:
+        patch_log.error("%s", e)
+        QMessageBox.critical(None, "Patching Error", f"Could not apply fix: {e}")
+        return False
+    except Exception as e:
+        patch_log.exception("Failed to apply fix to file: %s", e)
+        QMessageBox.critical(None, "Patching Error", f"Failed to write fix to file: {e}")
+        return False
+
+def hot_apply_function_code_fix(filepath, target_function_name, new_code_snippet):
+    """
+    Loads the fix into the running program and saves it to `filepath` in the background
+    (see hot_patch.py). Returns the HotPatch handle, or None if the function could not be reloaded.
+    """
+    patch_log.info("Reloading '%s' from %s in the running program", target_function_name, filepath)
+    try:
+        patch = hot_patch_function(filepath, target_function_name, new_code_snippet, note_lines=_fix_note_lines())
+    except PatchError as e:
+        patch_log.warning("Hot reload failed: %s", e)
+        return None
+    fix_cache.invalidate_function(filepath, target_function_name)
+    return patch
+
+def _fix_note_lines():
+    return [
+        f"Corrected by Gemini on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}",
+        f"Original error type: {os.environ.get('LAST_ERROR_TYPE', 'Unknown')}",
+        f"Original error message: {' '.join(os.environ.get('LAST_ERROR_MESSAGE', 'Unknown').split())}",
+    ]
+
+# --- 5. Main Error Handling and UI Orchestration ---
+def _function_object(frame, function_span):
+    """
+    Returns the live function for `function_span` if it can be reached from the frame's module
+    globals (top-level functions and methods), else None. Only used to read its signature.
+    """
+    target = frame.f_globals
+    for part in function_span.qualname.split("."):
+        if part == "<locals>":
+            return None
+        target = target.get(part) if isinstance(target, dict) else getattr(target, part, None)
+        if target is None:
+            return None
+    return target if inspect.isfunction(target) else None
+
+def ensure_qt_application():
+    """
+    Returns the running QApplication, creating one if the host application has none.
+    """
+    global _qt_app
+    app = QApplication.instance()
+    if app is None:
+        app = _qt_app = QApplication(sys.argv)
+    return app
+
+_qt_app = None # Keeps a QApplication created here alive
+
+def handle_application_error(exc_type, exc_value, exc_traceback, hot_reload=None, resumable=False, retry=None):
+    """
+    Shows the fix dialog for one error and re-raises it unless the fix was hot reloaded.
+    `resumable` means the program keeps running after this returns (asyncio errors, pyfixer.guard);
+    only then is an accepted fix loaded into the running program (with `hot_reload`, default:
+    PYFIXER_HOT_RELOAD) and its HotPatch returned. Otherwise the fix is saved for a restart.
+    `retry` (default: PYFIXER_HOT_RETRY) calls the reloaded function again with the failing call's
+    arguments; callers that re-run the call themselves, like pyfixer.guard, pass False.
+    """
+    hot_reload = DEFAULT_HOT_RELOAD if hot_reload is None else hot_reload
+    retry = DEFAULT_RETRY if retry is None else retry
+    if hot_reload and not resumable:
+        log.info("Hot reload skipped: the program is ending with this error, so an accepted fix is saved for a restart.")
+    tracing.incr("errors_handled")
+    with tracing.span("handler", error_type=exc_type.__name__):
+        return _handle_application_error(exc_type, exc_value, exc_traceback, hot_reload and resumable, retry)
+
+def _handle_application_error(exc_type, exc_value, exc_traceback, hot_reload=False, retry=False):
+    ensure_qt_application()
+    os.environ['LAST_ERROR_TYPE'] = exc_type.__name__
+    os.environ['LAST_ERROR_MESSAGE'] = str(exc_value)
+
+    tb_frames = traceback.extract_tb(exc_traceback)
+    error_info = {
+        "type": exc_type.__name__,
+        "message": str(exc_value),
+        "traceback": "".join(traceback.format_exception(exc_type, exc_value, exc_traceback)),
+        "frame_signature": frame_signature(tb_frames)
+    }
+    cluster, is_new_cluster = error_clusters.add(error_info["type"], error_info["message"], tb_frames, sample=error_info)
+    error_info["cluster_id"] = cluster.cluster_id
+    log.info("--- APPLICATION ERROR DETECTED ---")
+    log.info("%s", {k: v for k, v in error_info.items() if k != 'frame_signature'})
+
+    if not is_new_cluster and cluster.reviewed:
+        # Same error already reviewed in this process; don't ask Gemini or the user again.
+        tracing.incr("errors_already_reviewed")
+        log.info("Cluster %s seen %d times, already reviewed (%s). Re-raising original exception.",
+                 cluster.cluster_id, cluster.count, cluster.decision)
+        raise exc_value.with_traceback(exc_traceback)
+
+    current_script_path = None
+    function_that_errored_name = "unknown_function"
+    original_code_snippet = "Could not retrieve original code. Check traceback for file and line details."
+    # Used to slice the prompt down to the failing statement (see context_builder)
+    source_lines, start_line_num, failing_line_num = [], 1, None
+    # Frame whose call the verifier replays against the fix (arguments read by capture_snapshot)
+    target_frame, target_func = None, None
+
+    # Map the innermost application frame (any module) to its enclosing function, method or
+    # closure through the shared source index; files are re-parsed only when their mtime changes
+    live_frames = [frame for frame, _ in traceback.walk_tb(exc_traceback)]
+
+    lookup_span = tracing.span("lookup")
+    try:
+        with lookup_span:
+            located = locate_failing_function(tb_frames, code_qualnames(exc_traceback))
+            if located is None:
+                raise LookupError("no application function found in the traceback")
+
+            file_index, function_span, position = located
+            function_that_errored_name = function_span.qualname
+            current_script_path = file_index.path
+            failing_line_num = tb_frames[position].lineno
+            start_line_num = function_span.start_line
+            source_lines = file_index.lines[function_span.start_line - 1:function_span.end_line]
+            original_code_snippet = "".join(source_lines)
+            if any(is_project_frame(f.filename) for f in tb_frames[position + 1:]):
+                # The innermost application frame was module-level code; the fix targets its caller
+                log.warning("Falling back to patching '%s'.", function_that_errored_name)
+            target_frame = live_frames[position]
+            target_func = _function_object(target_frame, function_span)
+            log.info("Original code snippet extracted for '%s' (%s, lines %d-%d).", function_that_errored_name,
+                     os.path.basename(current_script_path), function_span.start_line, function_span.end_line)
+            lookup_span.set(function=function_that_errored_name)
+
+    except Exception as e:
+        log.warning("Critical Warning: Error during source code retrieval for '%s'. Error: %s", function_that_errored_name, e)
+        original_code_snippet = f"Error retrieving source code: {e}\n\n" + original_code_snippet
+
+    # Bounded text of the failing frames' locals for the prompt, and the literal call arguments
+    # for the verifier. The frames are cleared afterwards, so their objects are not kept alive
+    # while the dialog is open.
+    with tracing.span("snapshot") as snapshot_span:
+        snapshot = capture_snapshot(exc_traceback, target_frame=target_frame, target_func=target_func)
+        snapshot_span.set(bytes=snapshot.size, truncated=snapshot.truncated)
+    live_frames = target_frame = target_func = None
+    call_args = snapshot.call_args
+    if snapshot.frames:
+        error_info["locals"] = snapshot.format()
+        log.debug("Local values (%d bytes):\n%s", snapshot.size, error_info["locals"])
+
+    try:
+        log.debug("Attempting to create ErrorFixConfirmationUI instance (PyQt)...")
+
+        # Open the dialog right away and let the fix stream into it from a worker thread
+        fix_ui = ErrorFixConfirmationUI(error_info, original_code_snippet)
+        fix_prompt = None
+        if source_lines:
+            with tracing.span("prompt"):
+                fix_prompt = prepare_fix_prompt(error_info, tb_frames, source_lines, start_line_num, failing_line_num)
+        # The worker puts back the lines the model was shown only as elision markers, so the
+        # dialog, the verifier and the patcher all see the complete fix
+        fix_worker = GeminiFixWorker(
+            error_info, original_code_snippet,
+            filepath=current_script_path, function_name=function_that_errored_name,
+            prompt=fix_prompt.prompt if fix_prompt else None,
+            prepare=fix_prompt.restore if fix_prompt else None,
+            elided=fix_prompt.elided if fix_prompt else None,
+            full_prompt=fix_prompt.full_prompt if fix_prompt else None
+        )
+        fix_ui.attach_worker(fix_worker)
+        verify_worker = FixVerificationWorker(
+            current_script_path, function_that_errored_name, call_args, error_info["type"]
+        )
+        fix_ui.attach_verifier(verify_worker)
+        fix_worker.start()
+        log.info("Gemini request started in background. Showing UI (PyQt)...")
+
+        # run() blocks until the user decides
+        with tracing.span("ui_wait") as ui_span:
+            ui_result = fix_ui.run()
+            ui_span.set(result=ui_result)
+        tracing.incr("fixes_accepted" if ui_result == ErrorFixConfirmationUI.RESULT_ACCEPTED else "fixes_rejected")
+        if ui_result in (ErrorFixConfirmationUI.RESULT_ACCEPTED, ErrorFixConfirmationUI.RESULT_REJECTED):
+            # Closing the window or timing out is not a review; the next occurrence asks again
+            error_clusters.record_decision(cluster.cluster_id, ui_result)
+        suggested_fix = fix_ui.suggested_fix or "NO_FIX_AVAILABLE"
+        if ui_result == ErrorFixConfirmationUI.RESULT_REJECTED:
+            # Don't offer the same rejected fix again on the next run
+            fix_cache.invalidate(fix_cache_key(error_info, original_code_snippet))
+        if fix_ui.verification is not None:
+            log.info("Fix verification: %s", fix_ui.verification.to_dict())
+        if fix_worker.time_to_first_chunk is not None:
+            log.info("Time to first visible fix output: %.2fs.", fix_worker.time_to_first_chunk)
+
+        log.info("ErrorFixConfirmationUI returned '%s'. Checking user decision (PyQt).", ui_result)
+
+    except Exception as ui_error:
+        log.exception("FATAL ERROR: Exception occurred during UI creation or display (PyQt): %s", ui_error)
+        QMessageBox.critical(None, "UI Display Error",
+                             "The error handling UI could not be displayed due to an internal error (PyQt). "
+                             f"Please check console for details.\nError: {ui_error}")
+        # Re-raise the *original* exception, not the UI error
+        raise exc_value.with_traceback(exc_traceback)
+
+    if fix_ui.get_user_decision() and suggested_fix != "NO_FIX_AVAILABLE":
+        log.info("User accepted the fix! Attempting to apply...")
+        reloaded = hot_apply_function_code_fix(current_script_path, function_that_errored_name, suggested_fix) if hot_reload else None
+        if reloaded is not None:
+            message = "The fix is now running in this process and is being saved to the code file."
+            if retry and call_args is not None:
+                succeeded, outcome = retry_call(reloaded, call_args)
+                message += (f"\n\nRetried the failing call: it returned {outcome!r}." if succeeded
+                            else f"\n\nRetried the failing call: it still raised {type(outcome).__name__}: {outcome}")
+            QMessageBox.information(None, "Fix Applied", message)
+            log.info("--- Error handler finished. Fix reloaded in place; not re-raising ---")
+            return reloaded
+        if apply_function_code_fix(current_script_path, function_that_errored_name, suggested_fix):
+            QMessageBox.information(None, "Fix Applied", "Code file updated successfully. Please restart this script to run with the fix!")
+            sys.exit(0) # Exit cleanly after applying fix
+        else:
+            QMessageBox.critical(None, "Fix Failed", "Could not apply fix to file. Manual intervention required. See console for details.")
+    else:
+        log.info("User rejected the fix or no fix was available.")
+        QMessageBox.warning(None, "Fix Not Applied", "Fix not applied. The application may continue to encounter the error.")
+
+    log.info("--- Error handler finished. Re-raising original exception ---")
+    raise exc_value.with_traceback(exc_traceback) # Re-raise the original exception
@@ -0,0 +1,249 @@
+import os
+import json
+import time
+import atexit
+import threading
+import traceback
+from collections import OrderedDict, deque
+
+from . import tracing
+from .frame_snapshot import capture_snapshot
+
+# --- Background Fix Queue ---
+# Non-blocking mode for servers: the failing thread only captures a lightweight traceback summary
+# and drops it on a bounded in-process queue. A daemon worker fetches fix suggestions and appends
+# them to a JSONL file for later review. Heavy modules (model SDK, prompt building) are imported
+# by the worker thread, never on the hot path.
+
+DEFAULT_QUEUE_SIZE = 256
+DEFAULT_SUGGESTIONS_PATH = os.path.join(os.getcwd(), ".pyfixer_suggestions.jsonl")
+DEFAULT_DRAIN_TIMEOUT = float(os.environ.get("PYFIXER_DRAIN_TIMEOUT", "5"))
+# Rendering locals calls the application's __repr__ methods on the failing thread, and their
+# values can't be rendered later without keeping the objects alive and racing their mutation
+DEFAULT_CAPTURE_LOCALS = os.environ.get("PYFIXER_QUEUE_LOCALS", "0") == "1"
+
+POLICY_COALESCE = "coalesce"        # Same error already queued: bump its count instead of adding
+POLICY_DROP_NEWEST = "drop_newest"  # Queue full: discard the incoming error
+POLICY_DROP_OLDEST = "drop_oldest"  # Queue full: discard the oldest queued error
+
+log = tracing.get_logger("Queue")
+
+
+class CapturedError:
+    """
+    What the hot path keeps of an exception: no frame objects, no source lines, no formatting.
+    """
+    __slots__ = ("error_type", "message", "frames", "qualnames", "thread_name", "captured_at", "occurrences", "key", "snapshot")
+
+    def __init__(self, exc_type, exc_value, exc_traceback):
+        self.error_type = exc_type.__name__
+        self.message = str(exc_value)
+        # lookup_lines=False defers reading source files until the worker needs them
+        self.frames = traceback.StackSummary.extract(traceback.walk_tb(exc_traceback), lookup_lines=False)
+        # Qualified names tell same-named functions (methods, closures) apart in the worker's lookup
+        self.qualnames = [getattr(f.f_code, "co_qualname", f.f_code.co_name) for f, _ in traceback.walk_tb(exc_traceback)]
+        self.thread_name = threading.current_thread().name
+        self.captured_at = time.time()
+        self.occurrences = 1
+        self.key = (self.error_type, tuple((f.filename, f.name, f.lineno) for f in self.frames))
+        self.snapshot = None  # Bounded locals of the failing frame (frame_snapshot), only with capture_locals
+
+
+class BoundedFixQueue:
+    """
+    Bounded queue that never blocks the producer. When full, `policy` decides what is dropped.
+    With POLICY_COALESCE, repeats of an already-queued error only increment its count, and the
+    oldest error is dropped if the queue is full of distinct errors.
+    """
+
+    def __init__(self, maxsize=DEFAULT_QUEUE_SIZE, policy=POLICY_COALESCE):
+        if policy not in (POLICY_COALESCE, POLICY_DROP_NEWEST, POLICY_DROP_OLDEST):
+            raise ValueError(f"Unknown queue policy '{policy}'.")
+        self.maxsize = maxsize
+        self.policy = policy
+        self._items = OrderedDict() if policy == POLICY_COALESCE else deque()
+        self._not_empty = threading.Condition()
+        self.enqueued = 0
+        self.coalesced = 0
+        self.dropped = 0
+
+    def put(self, item):
+        """
+        Adds `item` without blocking. Returns False if it was dropped.
+        """
+        with self._not_empty:
+            if self.policy == POLICY_COALESCE:
+                queued = self._items.get(item.key)
+                if queued is not None:
+                    queued.occurrences += 1
+                    self.coalesced += 1
+                    return True
+                if len(self._items) >= self.maxsize:
+                    self._items.popitem(last=False)
+                    self.dropped += 1
+                self._items[item.key] = item
+            else:
+                if len(self._items) >= self.maxsize:
+                    self.dropped += 1
+                    if self.policy == POLICY_DROP_NEWEST:
+                        return False
+                    self._items.popleft()
+                self._items.append(item)
+            self.enqueued += 1
+            self._not_empty.notify()
+            return True
+
+    def get(self, timeout=None):
+        """
+        Removes and returns the oldest item, or None if nothing arrived within `timeout`.
+        """
+        with self._not_empty:
+            if not self._items and not self._not_empty.wait_for(lambda: self._items, timeout):
+                return None
+            if self.policy == POLICY_COALESCE:
+                return self._items.popitem(last=False)[1]
+            return self._items.popleft()
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        # Only meaningful with POLICY_COALESCE; other policies never merge errors
+        return self.policy == POLICY_COALESCE and key in self._items
+
+    def stats(self):
+        return {"queued": len(self._items), "enqueued": self.enqueued,
+                "coalesced": self.coalesced, "dropped": self.dropped}
+
+
+class BackgroundFixer:
+    """
+    Daemon worker that turns queued errors into persisted fix suggestions,
+    one model call per error cluster.
+    """
+
+    def __init__(self, suggestions_path=DEFAULT_SUGGESTIONS_PATH, maxsize=DEFAULT_QUEUE_SIZE, policy=POLICY_COALESCE,
+                 capture_locals=DEFAULT_CAPTURE_LOCALS):
+        self.queue = BoundedFixQueue(maxsize, policy)
+        self.suggestions_path = suggestions_path
+        self.capture_locals = capture_locals  # Byte-capped locals of the failing frame, rendered on the hot path
+        self._thread = None
+        self._stop = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._start_lock = threading.Lock()
+        self._clusters = None
+        self.processed = 0
+        self.failed = 0
+
+    # --- Hot path ---
+    def submit(self, exc_type, exc_value, exc_traceback):
+        """
+        Captures the error and queues it. The traceback is not retained.
+        """
+        item = CapturedError(exc_type, exc_value, exc_traceback)
+        if self.capture_locals and item.key not in self.queue:
+            # Repeats only bump the queued error's count, so they skip rendering locals
+            item.snapshot = capture_snapshot(exc_traceback, max_frames=1, release=False)
+        accepted = self.queue.put(item)
+        tracing.incr("errors_queued" if accepted else "errors_dropped")
+        if self._thread is None:
+            self.start()
+        return accepted
+
+    # --- Worker ---
+    def start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="pyfixer-background", daemon=True)
+                self._thread.start()
+                atexit.register(self.stop)
+
+    def stop(self, timeout=DEFAULT_DRAIN_TIMEOUT):
+        """
+        Gives the worker up to `timeout` seconds to finish queued errors, then stops it.
+        """
+        deadline = time.monotonic() + (timeout or 0)
+        while (len(self.queue) or not self._idle.is_set()) and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self._stop.set()
+
+    def _run(self):
+        from .fingerprint import ClusterIndex
+        self._clusters = ClusterIndex(max_clusters=4096)
+        while not self._stop.is_set():
+            item = self.queue.get(timeout=0.5)
+            if item is None:
+                continue
+            self._idle.clear()
+            try:
+                with tracing.span("queue_item", error_type=item.error_type, occurrences=item.occurrences):
+                    self._process(item)
+                self.processed += 1
+            except Exception as e:
+                self.failed += 1
+                log.warning("Could not get a fix for %s: %s", item.error_type, e)
+            finally:
+                self._idle.set()
+
+    def _process(self, item):
+        from .fix_cache import make_cache_key
+        from .fingerprint import frame_signature
+        from .gemini_fix import clean_fix_response
+        from .context_builder import estimate_tokens, locate_failing_function, prepare_fix_prompt
+        from .model_backend import get_backend
+
+        for frame in item.frames:
+            frame.line  # Reads the source line now, off the hot path
+        cluster, is_new = self._clusters.add(item.error_type, item.message, item.frames)
+        cluster.count += item.occurrences - 1  # Repeats coalesced while this error was queued
+        if not is_new:
+            return  # One model call per cluster
+
+        error_info = {
+            "type": item.error_type,
+            "message": item.message,
+            "traceback": "Traceback (most recent call last):\n" + "".join(item.frames.format()) + f"{item.error_type}: {item.message}\n",
+        }
+        if item.snapshot is not None and item.snapshot.frames:
+            error_info["locals"] = item.snapshot.format()
+        filepath, function_name, source_lines, start_line, failing_line = None, None, [], 1, None
+        located = locate_failing_function(item.frames, item.qualnames)
+        if located is not None:
+            file_index, span, position = located
+            filepath, function_name = file_index.path, span.qualname
+            source_lines = file_index.lines[span.start_line - 1:span.end_line]
+            start_line, failing_line = span.start_line, item.frames[position].lineno
+
+        with tracing.span("prompt"):
+            fix_prompt = prepare_fix_prompt(error_info, item.frames, source_lines, start_line, failing_line)
+
+        def generate(prompt):
+            tracing.incr("api_calls")
+            tracing.incr("tokens_sent", estimate_tokens(prompt))
+            with tracing.span("api", cluster_id=cluster.cluster_id):
+                return clean_fix_response(get_backend().generate(prompt))
+
+        fix = fix_prompt.request(generate)
+        self._persist({
+            "cluster_id": cluster.cluster_id,
+            "captured_at": item.captured_at,
+            "thread": item.thread_name,
+            "type": item.error_type,
+            "message": item.message,
+            "occurrences": item.occurrences,
+            "filepath": filepath,
+            "function": function_name,
+            "cache_key": make_cache_key(item.error_type, item.message, frame_signature(item.frames), "".join(source_lines)),
+            "traceback": error_info["traceback"],
+            "locals": error_info.get("locals"),
+            "fix": fix,
+        })
+
+    def _persist(self, record):
+        with open(self.suggestions_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+        log.info("Stored fix suggestion for %s in '%s' -> %s", record["type"], record["function"], self.suggestions_path)
+
+    def stats(self):
+        return dict(self.queue.stats(), processed=self.processed, failed=self.failed)
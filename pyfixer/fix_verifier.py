@@ -0,0 +1,333 @@
+import os
+import ast
+import sys
+import json
+import time
+import inspect
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+
+from . import tracing
+from .patch_engine import render_function_fixes, PatchError
+
+# --- Sandboxed Fix Verification ---
+# Before a suggestion is offered, the patched file is imported in a child Python process (under
+# its real module name from the project root, so package-relative imports work) with CPU, memory
+# and wall-clock limits, and the failing call is replayed with the
+# arguments captured from the traceback frame (only those that survive a repr/literal_eval
+# round trip). Several candidates are verified at once, one process each.
+#
+#   result = verify_fix(fix_code, "main.py", "divide_numbers", {"args": ["10", "0"], "kwargs": {}})
+#   result.status   -> "passed", "compiled", "same_error", "raised", "timeout", ...
+
+DEFAULT_TIMEOUT = float(os.environ.get("PYFIXER_VERIFY_TIMEOUT", "5"))
+DEFAULT_MEMORY_MB = int(os.environ.get("PYFIXER_VERIFY_MEMORY_MB", "512"))
+DEFAULT_WORKERS = os.cpu_count() or 2
+
+_RESULT_MARKER = "__PYFIXER_VERIFY_RESULT__ "
+
+log = tracing.get_logger("Verifier")
+
+
+class VerificationResult:
+    """
+    Outcome of verifying one candidate fix.
+    """
+    __slots__ = ("status", "detail", "elapsed", "replayed")
+
+    PASSED = "passed"            # Replayed call returned normally
+    COMPILED = "compiled"        # Patched module loaded; no replayable arguments
+    SAME_ERROR = "same_error"    # Replayed call raised the original exception type again
+    RAISED = "raised"            # Replayed call raised a different exception
+    LOAD_FAILED = "load_failed"  # Patched module raised while loading
+    INVALID = "invalid"          # Fix could not be spliced or does not compile
+    TIMEOUT = "timeout"
+    CRASHED = "crashed"          # Child died without reporting (e.g. memory limit)
+
+    def __init__(self, status, detail="", elapsed=0.0, replayed=False):
+        self.status = status
+        self.detail = detail
+        self.elapsed = elapsed
+        self.replayed = replayed
+
+    @property
+    def passed(self):
+        return self.status in (self.PASSED, self.COMPILED)
+
+    def summary(self):
+        label = {
+            self.PASSED: "Passed: replayed the failing call without an error",
+            self.COMPILED: "Compiled and loaded (failing call could not be replayed)",
+            self.SAME_ERROR: "Failed: the replayed call raised the same error",
+            self.RAISED: "Failed: the replayed call raised a different error",
+            self.LOAD_FAILED: "Failed: the patched module raised while loading",
+            self.INVALID: "Failed: the fix is not valid Python for this function",
+            self.TIMEOUT: "Failed: timed out",
+            self.CRASHED: "Failed: the verification process crashed",
+        }.get(self.status, self.status)
+        text = f"{label} ({self.elapsed:.2f}s)"
+        return f"{text}\n{self.detail}" if self.detail else text
+
+    def to_dict(self):
+        return {"status": self.status, "passed": self.passed, "replayed": self.replayed,
+                "elapsed": round(self.elapsed, 4), "detail": self.detail}
+
+    def __repr__(self):
+        return f"VerificationResult({self.status!r}, {self.elapsed:.2f}s)"
+
+
+def _literal_repr(value, max_chars=None):
+    # repr() of `value` if literal_eval gives back an equal value (and it is short enough), else None
+    try:
+        if max_chars is not None and isinstance(value, (str, bytes, list, tuple, dict, set, frozenset)) and len(value) > max_chars:
+            return None  # Too long before repr() builds the whole text
+        text = repr(value)
+        if max_chars is not None and len(text) > max_chars:
+            return None
+        return text if ast.literal_eval(text) == value else None
+    except Exception:
+        return None
+
+
+def capture_call_arguments(frame, func=None, max_bytes=None):
+    """
+    Reads the arguments of the call running in `frame` (values as of the failure).
+    Returns {"args": [repr, ...], "kwargs": {name: repr}} or None when any argument
+    is not a plain literal (or the reprs together exceed `max_bytes`) and the call
+    therefore cannot be replayed.
+    """
+    try:
+        signature = inspect.signature(func) if func is not None else None
+    except (TypeError, ValueError):
+        signature = None
+    code = frame.f_code
+    local_values = frame.f_locals
+    if signature is None:
+        names = code.co_varnames[:code.co_argcount]
+        kinds = {}
+    else:
+        names = list(signature.parameters)
+        kinds = {name: p.kind for name, p in signature.parameters.items()}
+
+    args, kwargs = [], {}
+    budget = [max_bytes]
+
+    def literal(value):
+        text = _literal_repr(value, budget[0])
+        if text is not None and budget[0] is not None:
+            budget[0] -= len(text)
+        return text
+
+    for name in names:
+        if name not in local_values:
+            return None
+        kind = kinds.get(name, inspect.Parameter.POSITIONAL_OR_KEYWORD)
+        value = local_values[name]
+        if kind == inspect.Parameter.VAR_POSITIONAL:
+            reprs = [literal(v) for v in value]
+            if None in reprs:
+                return None
+            args.extend(reprs)
+        elif kind == inspect.Parameter.VAR_KEYWORD:
+            for key, v in value.items():
+                text = literal(v)
+                if text is None:
+                    return None
+                kwargs[key] = text
+        else:
+            text = literal(value)
+            if text is None:
+                return None
+            if kind == inspect.Parameter.KEYWORD_ONLY:
+                kwargs[name] = text
+            else:
+                args.append(text)
+    return {"args": args, "kwargs": kwargs}
+
+
+def module_location(filepath):
+    """
+    Returns (dotted module name, sys.path root) to import `filepath` the way the program does:
+    the name it is loaded under in this process, else its package layout on disk.
+    """
+    path = os.path.abspath(filepath)
+    is_package = os.path.basename(path) == "__init__.py"
+    name = None
+    for module in list(sys.modules.values()):
+        module_file = getattr(module, "__file__", None)
+        spec = getattr(module, "__spec__", None)
+        if module_file and spec is not None and spec.name != "__main__" \
+                and os.path.normcase(os.path.abspath(module_file)) == os.path.normcase(path):
+            name = spec.name
+            break
+    if name is None:
+        # Walk up while the directory is a package
+        parts = [] if is_package else [os.path.splitext(os.path.basename(path))[0]]
+        directory = os.path.dirname(path)
+        while os.path.isfile(os.path.join(directory, "__init__.py")):
+            parts.insert(0, os.path.basename(directory))
+            directory = os.path.dirname(directory)
+        name = ".".join(parts)
+    root = os.path.dirname(path)
+    for _ in range(name.count(".") + (1 if is_package else 0)):
+        root = os.path.dirname(root)
+    return name, root
+
+
+def verify_fix(fix_code, filepath, function_name, call_args=None, error_type=None,
+               timeout=DEFAULT_TIMEOUT, memory_mb=DEFAULT_MEMORY_MB):
+    """
+    Splices `fix_code` into a copy of `filepath` (in memory), loads it in a sandboxed child
+    process and replays `function_name(*call_args)`. Returns a VerificationResult.
+    """
+    started = time.perf_counter()
+    try:
+        patched_text, qualnames, _ = render_function_fixes(filepath, {function_name: fix_code})
+    except PatchError as e:
+        return VerificationResult(VerificationResult.INVALID, str(e), time.perf_counter() - started)
+
+    module_name, root = module_location(filepath)
+    payload = {
+        "path": os.path.abspath(filepath),
+        "module": module_name,
+        "root": root,
+        "source": patched_text,
+        "qualname": qualnames[0],
+        "call_args": call_args,
+        "error_type": error_type,
+        "memory_mb": memory_mb,
+        "cpu_seconds": max(int(timeout) + 1, 1),
+    }
+    # Tells pyfixer.install() in the patched module not to hook the child's errors
+    env = dict(os.environ, PYFIXER_VERIFYING="1")
+    try:
+        # -m puts the working directory first on the child's path: the one holding the pyfixer
+        # package, not the project's (whose modules could shadow the stdlib the child imports)
+        completed = subprocess.run(
+            [sys.executable, "-m", f"{__package__}.fix_verifier", "--child"],
+            input=json.dumps(payload), capture_output=True, text=True, timeout=timeout,
+            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), env=env,
+        )
+    except subprocess.TimeoutExpired:
+        return VerificationResult(VerificationResult.TIMEOUT, f"No result within {timeout:g}s.", time.perf_counter() - started)
+
+    elapsed = time.perf_counter() - started
+    for line in reversed(completed.stdout.splitlines()):
+        if line.startswith(_RESULT_MARKER):
+            report = json.loads(line[len(_RESULT_MARKER):])
+            return VerificationResult(report["status"], report.get("detail", ""), elapsed, report.get("replayed", False))
+    detail = (completed.stderr.strip().splitlines() or [f"exit code {completed.returncode}"])[-1]
+    return VerificationResult(VerificationResult.CRASHED, detail, elapsed)
+
+
+def verify_candidates(candidates, filepath, function_name, call_args=None, error_type=None,
+                      timeout=DEFAULT_TIMEOUT, memory_mb=DEFAULT_MEMORY_MB, workers=DEFAULT_WORKERS):
+    """
+    Verifies several candidate fixes in parallel (one child process each).
+    Returns the VerificationResults in the order of `candidates`.
+    """
+    if not candidates:
+        return []
+    with ThreadPoolExecutor(max_workers=min(workers, len(candidates)), thread_name_prefix="pyfixer-verify") as pool:
+        futures = [pool.submit(verify_fix, code, filepath, function_name, call_args, error_type, timeout, memory_mb)
+                   for code in candidates]
+        results = [f.result() for f in futures]
+    passed = sum(1 for r in results if r.passed)
+    log.info("%d/%d candidate(s) passed verification.", passed, len(results))
+    return results
+
+
+# --- Child process ---
+def _apply_limits(memory_mb, cpu_seconds):
+    try:
+        import resource
+    except ImportError:
+        return  # Not available on Windows; only the wall-clock timeout applies
+    limit = memory_mb * 1024 * 1024
+    for name, value in (("RLIMIT_AS", limit), ("RLIMIT_CPU", cpu_seconds)):
+        kind = getattr(resource, name, None)
+        if kind is None:
+            continue
+        try:
+            resource.setrlimit(kind, (value, value))
+        except (ValueError, OSError):
+            pass
+
+
+def _report(status, detail="", replayed=False):
+    sys.stdout.write("\n" + _RESULT_MARKER + json.dumps({"status": status, "detail": detail[:500], "replayed": replayed}) + "\n")
+    sys.stdout.flush()
+
+
+def _patched_module_finder(module_name, path, source):
+    """
+    Meta path finder that serves `module_name` from `path` with the patched `source`;
+    every other module (including its parent packages) is imported normally.
+    """
+    import importlib.abc
+    import importlib.util
+
+    class PatchedSourceLoader(importlib.abc.SourceLoader):
+        def get_filename(self, fullname):
+            return path
+
+        def get_data(self, data_path):
+            with open(data_path, "rb") as f:
+                return f.read()
+
+        def get_code(self, fullname):
+            return compile(source, path, "exec", dont_inherit=True)
+
+    class PatchedModuleFinder(importlib.abc.MetaPathFinder):
+        def find_spec(self, fullname, search_path, target=None):
+            if fullname != module_name:
+                return None
+            return importlib.util.spec_from_file_location(fullname, path, loader=PatchedSourceLoader())
+
+    return PatchedModuleFinder()
+
+
+def _child_main():
+    import importlib
+
+    payload = json.loads(sys.stdin.read())
+    _apply_limits(payload["memory_mb"], payload["cpu_seconds"])
+    os.chdir(os.path.dirname(payload["path"]))  # Relative paths in the replayed call resolve as in the project
+    sys.path.insert(0, payload["root"])
+    sys.meta_path.insert(0, _patched_module_finder(payload["module"], payload["path"], payload["source"]))
+    sys.modules.pop(payload["module"], None)  # e.g. a project module named like one this process already uses
+
+    # Imported under its real name, so relative imports resolve and `if __name__ == "__main__"` blocks don't run
+    try:
+        module = importlib.import_module(payload["module"])
+    except BaseException as e:
+        _report(VerificationResult.LOAD_FAILED, f"{type(e).__name__}: {e}")
+        return
+
+    target = module
+    for part in payload["qualname"].split("."):
+        target = getattr(target, part, None)
+        if target is None or part == "<locals>":
+            target = None
+            break
+    call_args = payload.get("call_args")
+    if target is None or not callable(target) or call_args is None:
+        _report(VerificationResult.COMPILED)
+        return
+
+    args = [ast.literal_eval(a) for a in call_args.get("args", [])]
+    kwargs = {k: ast.literal_eval(v) for k, v in call_args.get("kwargs", {}).items()}
+    try:
+        value = target(*args, **kwargs)
+        if inspect.iscoroutine(value):
+            import asyncio
+            value = asyncio.run(value)
+    except BaseException as e:
+        status = VerificationResult.SAME_ERROR if type(e).__name__ == payload.get("error_type") else VerificationResult.RAISED
+        _report(status, f"{type(e).__name__}: {e}", replayed=True)
+        return
+    _report(VerificationResult.PASSED, f"Returned {value!r}", replayed=True)
+
+
+if __name__ == "__main__" and sys.argv[1:] == ["--child"]:
+    _child_main()
@@ -0,0 +1,196 @@
+import os
+import reprlib
+import traceback
+from collections import deque
+
+# --- Frame-Locals Snapshot ---
+# What the failing frames held when the error was raised, as short text: each local is
+# rendered with depth, length and size limits, large containers and arrays are summarized by
+# type and size, and the whole snapshot stays under a per-error byte cap. Once the snapshot
+# (and the literal call arguments for verification) are taken, the traceback's frames are
+# cleared so their objects can be freed while the user reviews the fix.
+#
+#   snapshot = capture_snapshot(exc_traceback, target_frame=frame, target_func=func)
+#   snapshot.format()     -> "In divide_numbers (main.py, line 12):\n    a = 10\n    b = 0"
+#   snapshot.call_args    -> {"args": ["10", "0"], "kwargs": {}} or None
+
+DEFAULT_MAX_BYTES = int(os.environ.get("PYFIXER_SNAPSHOT_BYTES", "4096"))
+DEFAULT_MAX_FRAMES = 3
+MAX_VALUE_CHARS = 200
+
+_SIZED_TYPES = (list, tuple, dict, set, frozenset, deque)
+
+
+class _SnapshotRepr(reprlib.Repr):
+    """
+    reprlib with tighter limits that also reports the size of anything it truncates.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.maxlevel = 2
+        self.maxlist = self.maxtuple = self.maxset = self.maxfrozenset = self.maxdeque = 6
+        self.maxdict = 4
+        self.maxstring = 80
+        self.maxlong = 40
+        self.maxother = 80
+
+    def repr1(self, x, level):
+        if isinstance(x, _SIZED_TYPES) and len(x) > self.maxlist:
+            return f"<{type(x).__name__} len={len(x)}> " + super().repr1(x, level)
+        if isinstance(x, (str, bytes)) and len(x) > self.maxstring:
+            return super().repr1(x, level) + f" (len={len(x)})"
+        summary = _array_summary(x)
+        if summary is not None:
+            return summary
+        return super().repr1(x, level)
+
+
+def _array_summary(value):
+    # numpy arrays, tensors, DataFrames, ...: shape and dtype instead of the contents
+    if isinstance(value, (str, bytes, int, float, bool, type(None)) + _SIZED_TYPES):
+        return None
+    try:
+        shape = getattr(value, "shape", None)
+        if shape is None or not isinstance(tuple(shape), tuple):
+            return None
+        dtype = getattr(value, "dtype", None)
+        if dtype is None:
+            dtype = getattr(value, "dtypes", None)
+            dtype = "mixed" if dtype is not None else None
+    except Exception:
+        return None
+    text = f"<{type(value).__name__} shape={tuple(shape)}"
+    return text + (f" dtype={dtype}>" if dtype is not None else ">")
+
+
+_repr = _SnapshotRepr()
+
+
+def safe_repr(value, max_chars=MAX_VALUE_CHARS):
+    """
+    Bounded repr of `value`; never raises.
+    """
+    try:
+        text = _repr.repr(value)
+    except Exception as e:
+        text = f"<{type(value).__name__}: repr failed: {type(e).__name__}>"
+    if len(text) > max_chars:
+        text = text[:max_chars - 3] + "..."
+    return text
+
+
+def _is_noise(name, value):
+    # Modules, functions and classes say nothing about the failing values
+    if name.startswith("__") and name.endswith("__"):
+        return True
+    return isinstance(value, type) or type(value).__name__ in ("module", "function", "builtin_function_or_method", "method")
+
+
+_project_files = {}  # filename -> is_project_frame(filename), memoized for the hot path
+
+
+def _is_project_frame(frame):
+    filename = frame.f_code.co_filename
+    result = _project_files.get(filename)
+    if result is None:
+        from .context_builder import is_project_frame
+        if len(_project_files) >= 4096:
+            _project_files.clear()
+        result = _project_files[filename] = is_project_frame(filename)
+    return result
+
+
+class FrameSnapshot:
+    """
+    Rendered locals of one frame.
+    """
+    __slots__ = ("filename", "lineno", "function", "values", "omitted")
+
+    def __init__(self, filename, lineno, function):
+        self.filename = filename
+        self.lineno = lineno
+        self.function = function
+        self.values = []    # (name, bounded repr)
+        self.omitted = 0    # Locals left out because the byte cap was reached
+
+    def to_dict(self):
+        return {"file": self.filename, "line": self.lineno, "function": self.function,
+                "locals": dict(self.values), "omitted": self.omitted}
+
+
+class ErrorSnapshot:
+    """
+    Locals of the innermost frames of one error (innermost first) plus the replayable call arguments.
+    """
+    __slots__ = ("frames", "call_args", "size", "max_bytes")
+
+    def __init__(self, max_bytes):
+        self.frames = []
+        self.call_args = None
+        self.size = 0
+        self.max_bytes = max_bytes
+
+    @property
+    def truncated(self):
+        return any(f.omitted for f in self.frames)
+
+    def format(self):
+        """
+        Text for the prompt, or "" when nothing was captured.
+        """
+        lines = []
+        for frame in self.frames:
+            lines.append(f"In {frame.function} ({os.path.basename(frame.filename)}, line {frame.lineno}):")
+            lines.extend(f"    {name} = {text}" for name, text in frame.values)
+            if frame.omitted:
+                lines.append(f"    ... {frame.omitted} more local(s) omitted")
+        return "\n".join(lines)
+
+    def to_dict(self):
+        return {"frames": [f.to_dict() for f in self.frames], "call_args": self.call_args, "bytes": self.size}
+
+
+def capture_snapshot(exc_traceback, target_frame=None, target_func=None, max_frames=DEFAULT_MAX_FRAMES,
+                     max_bytes=DEFAULT_MAX_BYTES, frame_filter=None, release=True):
+    """
+    Renders the locals of up to `max_frames` innermost frames accepted by `frame_filter`
+    (default: project frames) within `max_bytes`. The literal arguments of `target_frame`'s call
+    are captured first, since verification depends on them. With `release`, the traceback's
+    frames are cleared afterwards (see traceback.clear_frames); the traceback can still be
+    printed and re-raised.
+    """
+    frame_filter = frame_filter or _is_project_frame
+
+    snapshot = ErrorSnapshot(max_bytes)
+    try:
+        if target_frame is not None:
+            from .fix_verifier import capture_call_arguments
+            call_args = capture_call_arguments(target_frame, target_func, max_bytes=max_bytes)
+            if call_args is not None:
+                snapshot.call_args = call_args
+                snapshot.size += sum(len(a) for a in call_args["args"]) + sum(len(k) + len(v) for k, v in call_args["kwargs"].items())
+
+        for frame, lineno in reversed(list(traceback.walk_tb(exc_traceback))):
+            if max_frames and len(snapshot.frames) >= max_frames:
+                break
+            if not frame_filter(frame):
+                continue
+            code = frame.f_code
+            frame_snapshot = FrameSnapshot(code.co_filename, lineno, getattr(code, "co_qualname", code.co_name))
+            snapshot.frames.append(frame_snapshot)
+            if code.co_name == "<module>":
+                continue  # Module globals are not locals worth showing
+            for name, value in list(frame.f_locals.items()):
+                if _is_noise(name, value):
+                    continue
+                if snapshot.size >= max_bytes:
+                    frame_snapshot.omitted += 1
+                    continue
+                text = safe_repr(value, min(MAX_VALUE_CHARS, max(max_bytes - snapshot.size - len(name), 16)))
+                frame_snapshot.values.append((name, text))
+                snapshot.size += len(name) + len(text)
+    finally:
+        if release and exc_traceback is not None:
+            traceback.clear_frames(exc_traceback)
+    return snapshot
@@ -0,0 +1,69 @@
+import os
+
+from .fix_cache import make_cache_key
+
+# --- Headless Gemini Fix Helpers ---
+# Shared by the interactive handler (fix_handler.py), the background queue, batch triage and the
+# headless thread path; nothing here touches Qt.
+
+GEMINI_MODEL_NAME = 'models/gemini-2.5-pro'
+
+def configure_gemini():
+    """
+    Configures the Gemini SDK from GEMINI_API_KEY. Raises ValueError when the key is missing.
+    """
+    api_key = os.environ.get("GEMINI_API_KEY")
+    if not api_key:
+        api_key = "YOUR_GEMINI_API_KEY" # Placeholder
+    if api_key == "YOUR_GEMINI_API_KEY" or not api_key:
+        raise ValueError("GEMINI_API_KEY environment variable not set or placeholder used. Please configure your API key.")
+    import google.generativeai as genai
+    genai.configure(api_key=api_key)
+
+def build_fix_prompt(error_info, original_code_snippet):
+    """
+    Builds the prompt sent to Gemini for a single error.
+    """
+    local_values = ""
+    if error_info.get("locals"):
+        local_values = f"Local Values at the time of the error (reprs may be truncated):\n{error_info['locals']}\n"
+    elision_note = ""
+    if "[pyfixer: lines" in (original_code_snippet or ""):
+        elision_note = ("Some unchanged lines were omitted and replaced by '# ... [pyfixer: lines A-B unchanged]' comments. "
+                        "Return the complete corrected function and copy each of those comment lines unchanged where the omitted lines belong.")
+    return f"""
+    A Python application encountered an error. Please analyze the error information and provide a corrected version of the relevant code snippet.
+    Provide ONLY the corrected code snippet, nothing else. If you cannot fix it, return "NO_FIX_AVAILABLE".
+    {elision_note}
+
+    Error Type: {error_info.get('type', 'Unknown')}
+    Error Message: {error_info.get('message', 'No message')}
+    Traceback:
+    {error_info.get('traceback', 'No traceback')}
+    {local_values}
+    Original Code Snippet (from the function that caused the error, if available/relevant):
+    ```python
+    {original_code_snippet}
+    ```
+
+    Corrected Code:
+    """
+
+def clean_fix_response(response_text):
+    """
+    Strips markdown code fences from Gemini's answer. Returns "NO_FIX_AVAILABLE" if nothing is left.
+    """
+    fix_code = (response_text or "").strip()
+
+    if fix_code.startswith("```python"):
+        fix_code = fix_code[len("```python"):].strip()
+    if fix_code.endswith("```"):
+        fix_code = fix_code[:-len("```")].strip()
+
+    return fix_code or "NO_FIX_AVAILABLE"
+
+def fix_cache_key(error_info, original_code_snippet):
+    return make_cache_key(
+        error_info.get('type'), error_info.get('message'),
+        error_info.get('frame_signature'), original_code_snippet
+    )
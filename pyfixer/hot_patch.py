@@ -0,0 +1,310 @@
+import os
+import ast
+import sys
+import copy
+import types
+import inspect
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from . import tracing
+from .patch_engine import render_function_fixes, apply_function_fixes, split_fix, PatchError
+
+# --- In-Process Hot Reload ---
+# Instead of writing the fix and asking for a restart, the accepted function is compiled against
+# its module's globals and swapped into the running program:
+#   * the live function object gets the new __code__ (and defaults), so decorators, registries
+#     and any other references to it keep working;
+#   * when that is not possible (different closure variables, wrappers without __wrapped__),
+#     the decorated new function is rebound on its module or class instead.
+# Each swap returns a HotPatch handle that can roll it back. The on-disk write runs afterwards
+# on a background thread. Fixes to nested functions reload the outermost enclosing function.
+#
+#   patch = hot_patch_function("service.py", "Parser.parse", fix_code)
+#   patch.rollback()
+
+DEFAULT_HOT_RELOAD = os.environ.get("PYFIXER_HOT_RELOAD", "0") == "1"
+DEFAULT_RETRY = os.environ.get("PYFIXER_HOT_RETRY", "0") == "1"
+
+log = tracing.get_logger("HotPatch")
+
+applied_patches = []  # HotPatch handles in the order they were applied
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+class HotPatch:
+    """
+    Rollback handle for one function swapped into a running module.
+    """
+    __slots__ = ("filepath", "qualname", "owner", "attribute", "function", "old_state", "old_value",
+                 "rebound", "write_future", "rolled_back")
+
+    def __init__(self, filepath, qualname, owner, attribute):
+        self.filepath = filepath
+        self.qualname = qualname      # Reloaded function (the outermost one for nested fixes)
+        self.owner = owner            # Module or class the function lives on
+        self.attribute = attribute
+        self.function = None          # Live function whose __code__ was replaced
+        self.old_state = None         # (__code__, __defaults__, __kwdefaults__) before the swap
+        self.old_value = None         # Previous attribute value when the function was rebound
+        self.rebound = False
+        self.write_future = None      # Background disk write (see write_fix_async)
+        self.rolled_back = False
+
+    def current(self):
+        """
+        The callable as the running program now sees it (bound to the class for methods).
+        """
+        return getattr(self.owner, self.attribute)
+
+    def replacement_for(self, function):
+        """
+        What to call instead of `function`, a reference taken before the swap (e.g. by a decorator).
+        A code swap updated `function` in place, so that is `function` itself; a rebound fix gives
+        the new definition at the same depth of the decorator chain when `function` was part of
+        the replaced one.
+        """
+        if not self.rebound or self.rolled_back:
+            return function
+        old_chain = _wrapped_chain(self.old_value)
+        depth = next((i for i, value in enumerate(old_chain) if value is function), None)
+        new_chain = _wrapped_chain(vars(self.owner).get(self.attribute))
+        if depth is None or depth >= len(new_chain):
+            return function
+        return new_chain[depth]
+
+    def rollback(self):
+        """
+        Restores the function that ran before the swap. The on-disk fix is not undone.
+        """
+        if self.rolled_back:
+            return
+        if self.rebound:
+            setattr(self.owner, self.attribute, self.old_value)
+        else:
+            self.function.__code__, self.function.__defaults__, self.function.__kwdefaults__ = self.old_state
+        self.rolled_back = True
+        log.info("Rolled back '%s'.", self.qualname)
+
+    def __repr__(self):
+        how = "rebound" if self.rebound else "code swapped"
+        return f"HotPatch({self.qualname!r}, {how}{', rolled back' if self.rolled_back else ''})"
+
+
+def find_module(filepath):
+    """
+    Returns the loaded module whose __file__ is `filepath` (including __main__), or None.
+    """
+    path = os.path.normcase(os.path.abspath(filepath))
+    for module in list(sys.modules.values()):
+        module_file = getattr(module, "__file__", None)
+        if module_file and os.path.normcase(os.path.abspath(module_file)) == path:
+            return module
+    return None
+
+
+def _reloadable_qualname(qualname):
+    # Closures are recreated on every call of their outer function, so reload that instead
+    return qualname.split(".<locals>.", 1)[0]
+
+
+def _find_definition(tree, qualname):
+    """
+    Returns (def node, enclosing ClassDef nodes) for `qualname`, using the same naming as
+    patch_engine's index.
+    """
+    def visit(node, prefix, classes):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                if prefix + child.name == qualname:
+                    return child, classes
+                found = visit(child, prefix + child.name + ".<locals>.", [])
+            elif isinstance(child, ast.ClassDef):
+                found = visit(child, prefix + child.name + ".", classes + [child])
+            else:
+                found = visit(child, prefix, classes)
+            if found is not None:
+                return found
+        return None
+
+    return visit(tree, "", [])
+
+
+def _compile_definition(node, classes, filepath, module_globals, keep_decorators):
+    """
+    Executes the def against the module globals and returns the resulting object as it would
+    be stored on its owner (a function, or e.g. a staticmethod when decorators are kept).
+    Methods are compiled inside an empty class of the same name, so zero-argument super(),
+    __class__ and private name mangling behave as in the original class body (a rebound method's
+    __class__ cell is then pointed at the real class, see _bind_class_cell).
+    """
+    node = copy.copy(node)
+    if not keep_decorators:
+        node.decorator_list = []
+    statement = node
+    if classes:
+        wrapper = copy.copy(classes[-1])
+        wrapper.bases, wrapper.keywords, wrapper.decorator_list, wrapper.body = [], [], [], [node]
+        statement = wrapper
+    code = compile(ast.Module(body=[statement], type_ignores=[]), filepath, "exec")
+    namespace = {}
+    exec(code, module_globals, namespace)
+    if classes:
+        return vars(namespace[classes[-1].name])[node.name]
+    return namespace[node.name]
+
+
+def _wrapped_chain(value):
+    # The value stored on the owner followed by everything it wraps (functools.wraps __wrapped__)
+    if isinstance(value, (staticmethod, classmethod)):
+        value = value.__func__
+    chain = []
+    while value is not None and not any(value is seen for seen in chain):
+        chain.append(value)
+        value = getattr(value, "__wrapped__", None)
+    return chain
+
+
+def _bind_class_cell(value, name, owner):
+    # The stand-in class from _compile_definition filled the __class__ cell that zero-argument
+    # super() reads; point it at the real class
+    function = _live_function(value, name)
+    if isinstance(owner, type) and function is not None and "__class__" in function.__code__.co_freevars:
+        function.__closure__[function.__code__.co_freevars.index("__class__")].cell_contents = owner
+
+
+def _live_function(value, name):
+    # The plain function behind staticmethod/classmethod and functools.wraps-style decorators
+    if isinstance(value, (staticmethod, classmethod)):
+        value = value.__func__
+    seen = set()
+    while value is not None and id(value) not in seen:
+        seen.add(id(value))
+        if isinstance(value, types.FunctionType) and value.__code__.co_name == name:
+            return value
+        value = getattr(value, "__wrapped__", None)
+    return None
+
+
+def hot_patch_function(filepath, qualname, fix_code, note_lines=None, write=True):
+    """
+    Applies `fix_code` for `qualname` to the running module loaded from `filepath` and, with
+    `write`, saves it to the file on a background thread. Returns a HotPatch.
+    Raises PatchError when the fix cannot be spliced or the module is not loaded.
+    """
+    new_text, qualnames, _ = render_function_fixes(filepath, {qualname: fix_code}, note_lines)
+    module = find_module(filepath)
+    if module is None:
+        raise PatchError(f"{filepath} is not loaded in this process.")
+
+    target = _reloadable_qualname(qualnames[0])
+    found = _find_definition(ast.parse(new_text, filename=filepath), target)
+    if found is None:
+        raise PatchError(f"Could not find '{target}' in the patched source.")
+    node, classes = found
+
+    owner = module
+    parts = target.split(".")
+    for part in parts[:-1]:
+        owner = getattr(owner, part, None)
+        if owner is None:
+            raise PatchError(f"'{target}' is not reachable from module {module.__name__}.")
+    attribute = parts[-1]
+    current = vars(owner).get(attribute)
+    if current is None:
+        raise PatchError(f"'{target}' is not defined in the running module {module.__name__}.")
+
+    patch = HotPatch(os.path.abspath(filepath), target, owner, attribute)
+    with tracing.span("hot_patch", function=target) as patch_span:
+        try:
+            # Imports that came with the fix were added at module level in the file; bind them here too
+            for statement in split_fix(fix_code, qualnames[0].rsplit(".", 1)[-1])[0]:
+                exec(compile(statement, filepath, "exec"), module.__dict__)
+            new_function = _compile_definition(node, classes, filepath, module.__dict__, keep_decorators=False)
+            live = _live_function(current, node.name)
+            if live is not None and live.__code__.co_freevars == new_function.__code__.co_freevars:
+                patch.function = live
+                patch.old_state = (live.__code__, live.__defaults__, live.__kwdefaults__)
+                live.__code__ = new_function.__code__
+                live.__defaults__, live.__kwdefaults__ = new_function.__defaults__, new_function.__kwdefaults__
+            else:
+                # Re-evaluates the decorators; references taken before this keep the old function
+                replacement = _compile_definition(node, classes, filepath, module.__dict__, keep_decorators=True)
+                _bind_class_cell(replacement, node.name, owner)
+                patch.old_value = current
+                patch.rebound = True
+                setattr(owner, attribute, replacement)
+        except PatchError:
+            raise
+        except Exception as e:
+            raise PatchError(f"Could not load the fix for '{target}' into the running program: {e}")
+        patch_span.set(rebound=patch.rebound)
+
+    applied_patches.append(patch)
+    tracing.incr("fixes_hot_patched")
+    log.info("Reloaded '%s' in module %s (%s).", target, module.__name__,
+             "rebound" if patch.rebound else "code swapped")
+    if write:
+        patch.write_future = write_fix_async(filepath, {qualname: fix_code}, note_lines)
+    return patch
+
+
+def retry_call(patch, call_args):
+    """
+    Calls the patched function again with the failing call's literal arguments
+    (see frame_snapshot/fix_verifier). Returns (succeeded, result or exception).
+    """
+    args = [ast.literal_eval(a) for a in call_args.get("args", [])]
+    kwargs = {k: ast.literal_eval(v) for k, v in call_args.get("kwargs", {}).items()}
+    try:
+        value = patch.current()(*args, **kwargs)
+    except Exception as e:
+        log.warning("Retried call of '%s' raised %s: %s", patch.qualname, type(e).__name__, e)
+        return False, e
+    if inspect.iscoroutine(value):
+        value.close()  # Cannot await from the error hook; the coroutine is not run
+        return False, RuntimeError("coroutine functions are not retried")
+    log.info("Retried call of '%s' returned %r.", patch.qualname, value)
+    return True, value
+
+
+def rollback_all():
+    """
+    Rolls back every hot patch, newest first.
+    """
+    while applied_patches:
+        applied_patches.pop().rollback()
+
+
+# --- Background disk write ---
+def _get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            # One thread keeps writes to the same file in order; pending writes finish at exit
+            _writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="pyfixer-write")
+    return _writer
+
+
+def write_fix_async(filepath, fixes, note_lines=None):
+    """
+    Writes `fixes` to `filepath` on the writer thread (see patch_engine.apply_function_fixes).
+    Returns a Future with the patched names; failures are logged.
+    """
+    def write():
+        with tracing.span("patch", function=", ".join(fixes), background=True):
+            return apply_function_fixes(filepath, fixes, note_lines=note_lines)
+
+    def done(future):
+        error = future.exception()
+        if error is not None:
+            log.error("Could not save the fix to %s: %s", filepath, error)
+        else:
+            tracing.incr("fixes_applied")
+            log.info("Fix saved to %s.", filepath)
+
+    future = _get_writer().submit(write)
+    future.add_done_callback(done)
+    return future
@@ -0,0 +1,256 @@
+import re
+import ast
+import sys
+import json
+import time
+import random
+import argparse
+import textwrap
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from datetime import datetime
+
+# --- Local Stand-In Model Server ---
+# Speaks the protocol HTTPBackend expects, so the whole pipeline can run offline:
+#   GET  /v1/health
+#   POST /v1/generate  {"prompt": ...}  -> {"text": ...}
+#   POST /v1/stream    {"prompt": ...}  -> newline-delimited {"text": ...} chunks
+# Answers come from a canned JSON file (error type -> fix) or from simple built-in rules.
+#
+#   python -m pyfixer.local_fix_server --port 8765 --latency 0.5
+#   PYFIXER_BACKEND=http://127.0.0.1:8765 python main.py
+#
+#   python -m pyfixer.local_fix_server --bench 200    # client reuse vs. per-call construction
+
+_ERROR_TYPE_RE = re.compile(r"Error Type:\s*(\S+)")
+_CODE_BLOCK_RE = re.compile(r"```python\n(?P<code>.*?)\n(?P<indent>[ \t]*)```", re.DOTALL)
+
+
+def _parse_prompt(prompt):
+    error_type = _ERROR_TYPE_RE.search(prompt or "")
+    match = _CODE_BLOCK_RE.search(prompt or "")
+    code = ""
+    if match:
+        # The prompt template indents only the first line of the snippet; undo that before dedenting
+        code = match.group("code")
+        if code.startswith(match.group("indent")):
+            code = code[len(match.group("indent")):]
+        code = textwrap.dedent(code).strip("\n")
+    return (error_type.group(1) if error_type else None), code
+
+
+def _statement_at(tree, lineno):
+    best = None
+    for node in ast.walk(tree):
+        if isinstance(node, ast.stmt) and not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            if node.lineno <= lineno <= (node.end_lineno or node.lineno):
+                if best is None or node.lineno >= best.lineno:
+                    best = node
+    return best
+
+
+def _guard_zero_division(code):
+    # Return None instead of dividing when the denominator is zero
+    tree = ast.parse(code)
+    division = next((n for n in ast.walk(tree) if isinstance(n, ast.BinOp) and isinstance(n.op, (ast.Div, ast.FloorDiv, ast.Mod))), None)
+    if division is None:
+        return None
+    denominator = ast.get_source_segment(code, division.right)
+    stmt = _statement_at(tree, division.lineno)
+    if stmt is None or denominator is None:
+        return None
+    lines = code.splitlines()
+    indent = " " * stmt.col_offset
+    guard = [f"{indent}if {denominator} == 0:", f"{indent}    return None"]
+    return "\n".join(lines[:stmt.lineno - 1] + guard + lines[stmt.lineno - 1:])
+
+
+def _use_dict_get(code):
+    # Replace the first d[key] read with d.get(key)
+    tree = ast.parse(code)
+    subscript = next((n for n in ast.walk(tree) if isinstance(n, ast.Subscript) and isinstance(n.ctx, ast.Load)), None)
+    if subscript is None or subscript.lineno != subscript.end_lineno:
+        return None
+    value = ast.get_source_segment(code, subscript.value)
+    key = ast.get_source_segment(code, subscript.slice)
+    lines = code.splitlines()
+    line = lines[subscript.lineno - 1]
+    lines[subscript.lineno - 1] = line[:subscript.col_offset] + f"{value}.get({key})" + line[subscript.end_col_offset:]
+    return "\n".join(lines)
+
+
+RULES = {
+    "ZeroDivisionError": _guard_zero_division,
+    "KeyError": _use_dict_get,
+}
+
+
+class FixResponder:
+    """
+    Produces the canned or rule-based answer for a prompt. With `echo`, prompts no rule
+    covers get their code snippet back unchanged instead of NO_FIX_AVAILABLE.
+    """
+
+    def __init__(self, canned=None, echo=False):
+        self.canned = canned or {}
+        self.echo = echo
+
+    def respond(self, prompt):
+        error_type, code = _parse_prompt(prompt)
+        if error_type in self.canned:
+            return self.canned[error_type]
+        rule = RULES.get(error_type)
+        if not code:
+            return "NO_FIX_AVAILABLE"
+        fixed = None
+        if rule is not None:
+            try:
+                fixed = rule(code)
+            except SyntaxError:
+                pass
+        if fixed is None and self.echo:
+            fixed = code
+        return f"```python\n{fixed}\n```" if fixed else "NO_FIX_AVAILABLE"
+
+
+class FixRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keep-alive, so clients can reuse connections
+    disable_nagle_algorithm = True  # Headers and body are separate writes; avoid delayed-ACK stalls
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _sleep(self):
+        delay = self.server.latency + random.uniform(0, self.server.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def do_GET(self):
+        if self.path.endswith("/v1/health"):
+            self._send_json(200, {"status": "ok"})
+        else:
+            self._send_json(404, {"error": "not found"})
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": "invalid JSON"})
+            return
+        text = self.server.responder.respond(payload.get("prompt", ""))
+        self._sleep()
+
+        if self.path.endswith("/v1/generate"):
+            self._send_json(200, {"text": text})
+        elif self.path.endswith("/v1/stream"):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            size = self.server.chunk_size
+            try:
+                for i in range(0, len(text), size):
+                    line = (json.dumps({"text": text[i:i + size]}) + "\n").encode("utf-8")
+                    self.wfile.write(f"{len(line):X}\r\n".encode("ascii") + line + b"\r\n")
+                    self.wfile.flush()
+                    if self.server.chunk_delay:
+                        time.sleep(self.server.chunk_delay)
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                # Client abandoned the stream (e.g. a speculative candidate that lost the race)
+                self.close_connection = True
+        else:
+            self._send_json(404, {"error": "not found"})
+
+
+def start_server(host="127.0.0.1", port=8765, latency=0.0, jitter=0.0, chunk_size=40, chunk_delay=0.0,
+                 canned=None, verbose=False):
+    """
+    Starts the stand-in server on a daemon thread and returns it (port 0 picks a free port).
+    """
+    server = ThreadingHTTPServer((host, port), FixRequestHandler)
+    server.daemon_threads = True
+    server.responder = FixResponder(canned)
+    server.latency = latency
+    server.jitter = jitter
+    server.chunk_size = chunk_size
+    server.chunk_delay = chunk_delay
+    server.verbose = verbose
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def benchmark_client_reuse(base_url, requests=200):
+    """
+    Times `requests` calls through one long-lived HTTPBackend against a new backend per call.
+    """
+    from .model_backend import HTTPBackend
+
+    prompt = "Error Type: ZeroDivisionError\n```python\ndef f(a, b):\n    return a / b\n```"
+    results = {}
+
+    started = time.perf_counter()
+    backend = HTTPBackend(base_url)
+    for _ in range(requests):
+        backend.generate(prompt)
+    backend.close()
+    results["reused_client_s"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for _ in range(requests):
+        backend = HTTPBackend(base_url)
+        backend.generate(prompt)
+        backend.close()
+    results["per_call_client_s"] = time.perf_counter() - started
+
+    for key in ("reused_client_s", "per_call_client_s"):
+        print(f"[Bench] {key}: {results[key]:.3f}s total, {results[key] / requests * 1000:.2f} ms/request")
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline stand-in for the Gemini fix backend.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Extra random latency, up to this many seconds")
+    parser.add_argument("--chunk-size", type=int, default=40, help="Characters per streamed chunk")
+    parser.add_argument("--chunk-delay", type=float, default=0.0, help="Seconds between streamed chunks")
+    parser.add_argument("--canned", help="JSON file mapping error type to the fix text to return")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    parser.add_argument("--bench", type=int, metavar="N", help="Run N requests comparing client reuse vs per-call construction, then exit")
+    args = parser.parse_args(argv)
+
+    canned = None
+    if args.canned:
+        with open(args.canned, "r", encoding="utf-8") as f:
+            canned = json.load(f)
+
+    server = start_server(args.host, 0 if args.bench else args.port, args.latency, args.jitter,
+                          args.chunk_size, args.chunk_delay, canned, args.verbose)
+    host, port = server.server_address[:2]
+    if args.bench:
+        benchmark_client_reuse(f"http://{host}:{port}", args.bench)
+        server.shutdown()
+        return 0
+
+    print(f"[{datetime.now().strftime('%H:%M:%S')}] [Server] Local fix server listening on http://{host}:{port}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
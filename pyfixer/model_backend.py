@@ -0,0 +1,247 @@
+import os
+import abc
+import json
+import threading
+import http.client
+from urllib.parse import urlsplit
+
+from .gemini_fix import GEMINI_MODEL_NAME, configure_gemini
+
+# --- Model Backends ---
+# One long-lived client per process instead of a new GenerativeModel per request.
+# PYFIXER_BACKEND selects the implementation:
+#   gemini (default)        Google Gemini via google.generativeai
+#   http://host:port        Any server speaking the local_fix_server.py protocol (offline runs, CI, load tests)
+
+# Idle keep-alive connections kept per HTTP backend; extra concurrent calls open (and then close) their own
+DEFAULT_MAX_IDLE_CONNECTIONS = int(os.environ.get("PYFIXER_MAX_CONNECTIONS", "4"))
+
+
+class ModelConfig:
+    """
+    Model name, sampling temperature and request timeout shared by every call of a backend.
+    """
+
+    def __init__(self, model_name=GEMINI_MODEL_NAME, temperature=None, timeout=120.0):
+        self.model_name = model_name
+        self.temperature = temperature
+        self.timeout = timeout
+
+    @classmethod
+    def from_env(cls):
+        temperature = os.environ.get("PYFIXER_TEMPERATURE")
+        return cls(
+            model_name=os.environ.get("PYFIXER_MODEL", GEMINI_MODEL_NAME),
+            temperature=float(temperature) if temperature else None,
+            timeout=float(os.environ.get("PYFIXER_TIMEOUT", "120")),
+        )
+
+
+class ModelBackend(abc.ABC):
+    """
+    Interface for fix-generating models. Implementations must be safe to call from several threads.
+    """
+
+    def __init__(self, config=None):
+        self.config = config or ModelConfig.from_env()
+
+    def check(self):
+        """
+        Verifies the backend is usable (credentials, reachability). Raises on failure.
+        """
+
+    @abc.abstractmethod
+    def generate(self, prompt, temperature=None):
+        """
+        Returns the complete response text for `prompt`.
+        """
+
+    def stream(self, prompt, temperature=None):
+        """
+        Yields the response text in chunks as it arrives.
+        """
+        yield self.generate(prompt, temperature)
+
+    def close(self):
+        pass
+
+
+class GeminiBackend(ModelBackend):
+    """
+    Gemini through a single GenerativeModel that is created on first use and then reused.
+    """
+
+    def __init__(self, config=None):
+        super().__init__(config)
+        self._model = None
+        self._lock = threading.Lock()
+
+    def check(self):
+        self._get_model()
+
+    def _get_model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    import google.generativeai as genai
+                    configure_gemini()
+                    self._model = genai.GenerativeModel(self.config.model_name)
+        return self._model
+
+    def _generation_config(self, temperature):
+        temperature = self.config.temperature if temperature is None else temperature
+        return {"temperature": temperature} if temperature is not None else None
+
+    def generate(self, prompt, temperature=None):
+        response = self._get_model().generate_content(
+            prompt, generation_config=self._generation_config(temperature),
+            request_options={"timeout": self.config.timeout}
+        )
+        return response.text
+
+    def stream(self, prompt, temperature=None):
+        response = self._get_model().generate_content(
+            prompt, generation_config=self._generation_config(temperature),
+            request_options={"timeout": self.config.timeout}, stream=True
+        )
+        for chunk in response:
+            if chunk.text:
+                yield chunk.text
+
+
+class HTTPBackend(ModelBackend):
+    """
+    Client for local_fix_server.py (or anything speaking its protocol). Keep-alive connections are
+    shared through a small pool, so repeated calls from any thread skip the TCP handshake while
+    short-lived threads (one worker per error, one per candidate) leave nothing open behind them.
+    """
+
+    def __init__(self, base_url, config=None, max_idle=DEFAULT_MAX_IDLE_CONNECTIONS):
+        super().__init__(config)
+        parts = urlsplit(base_url)
+        self.host = parts.hostname or "127.0.0.1"
+        self.https = parts.scheme == "https"
+        self.port = parts.port or (443 if self.https else 80)
+        self.base_path = parts.path.rstrip("/")
+        self.max_idle = max_idle
+        self._idle = []  # Connections ready for reuse, most recently used last
+        self._lock = threading.Lock()
+
+    def _checkout(self):
+        with self._lock:
+            if self._idle:
+                return self._idle.pop()
+        connection_class = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+        return connection_class(self.host, self.port, timeout=self.config.timeout)
+
+    def _checkin(self, conn):
+        # Only connections whose last response was read to the end can be reused
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def _post(self, path, payload):
+        """
+        Returns (connection, response). The caller reads the response and then checks the
+        connection back in (or closes it if the response was abandoned).
+        """
+        body = json.dumps(payload).encode("utf-8")
+        headers = {"Content-Type": "application/json", "Connection": "keep-alive"}
+        for attempt in range(2):
+            conn = self._checkout()
+            try:
+                conn.request("POST", self.base_path + path, body=body, headers=headers)
+                response = conn.getresponse()
+            except (http.client.HTTPException, ConnectionError):
+                # Server closed the idle connection; reconnect once
+                conn.close()
+                if attempt:
+                    raise
+                continue
+            except BaseException:
+                conn.close()
+                raise
+            if response.status != 200:
+                detail = response.read().decode("utf-8", "replace")
+                self._checkin(conn)
+                raise RuntimeError(f"Model server returned {response.status}: {detail}")
+            return conn, response
+
+    def _payload(self, prompt, temperature):
+        temperature = self.config.temperature if temperature is None else temperature
+        return {"prompt": prompt, "model": self.config.model_name, "temperature": temperature}
+
+    def check(self):
+        conn = self._checkout()
+        try:
+            conn.request("GET", self.base_path + "/v1/health")
+            response = conn.getresponse()
+            response.read()
+        except BaseException:
+            conn.close()
+            raise
+        self._checkin(conn)
+        if response.status != 200:
+            raise RuntimeError(f"Model server at {self.host}:{self.port} is not healthy ({response.status}).")
+
+    def generate(self, prompt, temperature=None):
+        conn, response = self._post("/v1/generate", self._payload(prompt, temperature))
+        try:
+            text = json.loads(response.read().decode("utf-8"))["text"]
+        except BaseException:
+            conn.close()
+            raise
+        self._checkin(conn)
+        return text
+
+    def stream(self, prompt, temperature=None):
+        conn, response = self._post("/v1/stream", self._payload(prompt, temperature))
+        finished = False
+        try:
+            for line in response:
+                line = line.strip()
+                if line:
+                    yield json.loads(line.decode("utf-8"))["text"]
+            finished = True
+        finally:
+            if finished:
+                self._checkin(conn)
+            else:
+                # Abandoned mid-stream (e.g. cancelled); the connection can't be reused
+                conn.close()
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+
+def create_backend(spec=None, config=None):
+    """
+    Builds a backend from a spec string ("gemini" or an http:// URL).
+    """
+    spec = spec or os.environ.get("PYFIXER_BACKEND", "gemini")
+    if spec.startswith(("http://", "https://")):
+        return HTTPBackend(spec, config)
+    if spec == "gemini":
+        return GeminiBackend(config)
+    raise ValueError(f"Unknown model backend '{spec}'. Use 'gemini' or an http:// URL.")
+
+
+_default_backend = None
+_default_backend_lock = threading.Lock()
+
+
+def get_backend():
+    """
+    Returns the process-wide backend, created from the environment on first use.
+    """
+    global _default_backend
+    if _default_backend is None:
+        with _default_backend_lock:
+            if _default_backend is None:
+                _default_backend = create_backend()
+    return _default_backend
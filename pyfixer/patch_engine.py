@@ -0,0 +1,402 @@
+import os
+import ast
+import hashlib
+import tempfile
+import textwrap
+import threading
+import tokenize
+from bisect import bisect_right
+from collections import OrderedDict
+from io import BytesIO
+
+from .tracing import get_logger
+
+# --- AST-Indexed Patch Engine ---
+# Each source file is parsed once into an index of qualified name -> exact line range.
+# The index is rebuilt only when the file's mtime/size (and then its content hash) change.
+# Traceback frames from any project module are mapped to their enclosing function, method or
+# closure through the same index (SourceIndex.resolve), so repeated errors re-read nothing.
+# Fixes are applied as span splices over the indexed lines and written atomically.
+
+
+DEFAULT_MAX_FILES = 512
+
+log = get_logger("Patcher")
+
+
+class PatchError(Exception):
+    """
+    Raised when a fix cannot be located, spliced or validated. The file is left untouched.
+    """
+
+
+class FunctionSpan:
+    """
+    Location of one function or method. Line numbers are 1-based and inclusive.
+    """
+    __slots__ = ("qualname", "name", "start_line", "def_line", "body_line", "end_line", "indent", "is_async",
+                 "docstring_end_line")
+
+    def __init__(self, qualname, name, start_line, def_line, body_line, end_line, indent, is_async,
+                 docstring_end_line=None):
+        self.qualname = qualname      # Same convention as __qualname__, e.g. "Parser.<locals>.helper"
+        self.name = name
+        self.start_line = start_line  # First decorator line, or the def line
+        self.def_line = def_line
+        self.body_line = body_line    # First statement of the body
+        self.end_line = end_line
+        self.indent = indent          # Column of the def keyword
+        self.is_async = is_async
+        self.docstring_end_line = docstring_end_line  # Last line of a leading docstring, if any
+
+    def __repr__(self):
+        return f"FunctionSpan({self.qualname!r}, lines {self.start_line}-{self.end_line})"
+
+
+class FileIndex:
+    """
+    Parsed view of one source file: its lines plus every function span by qualified name.
+    """
+
+    def __init__(self, path, mtime_ns, size, digest, encoding, lines, functions, import_line=0):
+        self.path = path
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.digest = digest
+        self.encoding = encoding
+        self.lines = lines            # Lines with their original line endings
+        self.newline = "\r\n" if lines and lines[0].endswith("\r\n") else "\n"
+        self.functions = functions    # qualname -> FunctionSpan
+        self.import_line = import_line  # New module-level imports go after this line (0 = top)
+        self._by_start = None         # Spans sorted by start line, built on the first enclosing() call
+        self._starts = None
+
+    def find(self, name):
+        """
+        Looks up a function by qualified name, falling back to its plain name
+        (the outermost match wins when several functions share it).
+        """
+        span = self.functions.get(name)
+        if span is not None:
+            return span
+        matches = [s for s in self.functions.values() if s.name == name or s.qualname.endswith("." + name)]
+        if not matches:
+            return None
+        return min(matches, key=lambda s: (s.qualname.count("."), s.start_line))
+
+    def enclosing(self, lineno, name=None):
+        """
+        Returns the innermost function whose span contains `lineno`, or None for module-level code.
+        `name` is the frame's code name (co_qualname or co_name); when one of the containing
+        functions matches it, that one wins, so a lambda or comprehension maps to its def.
+        """
+        if self._by_start is None:
+            self._by_start = sorted(self.functions.values(), key=lambda s: s.start_line)
+            self._starts = [s.start_line for s in self._by_start]
+        # Scanning back from the last span starting at or before `lineno` visits the
+        # containing spans innermost first
+        containing = [span for span in reversed(self._by_start[:bisect_right(self._starts, lineno)])
+                      if span.end_line >= lineno]
+        if not containing:
+            return None
+        if name:
+            for span in containing:
+                if span.qualname == name:
+                    return span
+            for span in containing:
+                if span.name == name:
+                    return span
+        return containing[0]
+
+    def source_of(self, span):
+        return "".join(self.lines[span.start_line - 1:span.end_line])
+
+
+def _is_docstring(node):
+    return isinstance(node, ast.Expr) and isinstance(node.value, ast.Constant) and isinstance(node.value.value, str)
+
+
+def _collect_functions(tree):
+    functions = {}
+
+    def visit(node, prefix):
+        for child in ast.iter_child_nodes(node):
+            if isinstance(child, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                qualname = prefix + child.name
+                start_line = min([d.lineno for d in child.decorator_list] + [child.lineno])
+                docstring = child.body[0] if _is_docstring(child.body[0]) else None
+                functions[qualname] = FunctionSpan(
+                    qualname, child.name, start_line, child.lineno, child.body[0].lineno,
+                    child.end_lineno, child.col_offset, isinstance(child, ast.AsyncFunctionDef),
+                    docstring.end_lineno if docstring is not None else None
+                )
+                visit(child, qualname + ".<locals>.")
+            elif isinstance(child, ast.ClassDef):
+                visit(child, prefix + child.name + ".")
+            else:
+                visit(child, prefix)
+
+    visit(tree, "")
+    return functions
+
+
+def _import_line(tree):
+    # End of the leading docstring/import block, or the line before the first statement
+    line = None
+    for position, node in enumerate(tree.body):
+        if isinstance(node, (ast.Import, ast.ImportFrom)) or (position == 0 and _is_docstring(node)):
+            line = node.end_lineno
+            continue
+        if line is None:
+            line = min([d.lineno for d in getattr(node, "decorator_list", [])] + [node.lineno]) - 1
+        break
+    return line or 0
+
+
+def _decode_source(raw):
+    encoding, _ = tokenize.detect_encoding(BytesIO(raw).readline)
+    return raw.decode(encoding), encoding
+
+
+class SourceIndex:
+    """
+    Thread-safe cache of FileIndex objects keyed by absolute path.
+    The least recently used file is dropped once more than `max_files` are cached.
+    """
+
+    def __init__(self, max_files=DEFAULT_MAX_FILES):
+        self._files = OrderedDict()
+        self._lock = threading.Lock()
+        self.max_files = max_files
+        self.parses = 0
+        self.reuses = 0
+
+    def get(self, filepath):
+        """
+        Returns an up-to-date FileIndex for `filepath`. Raises OSError/SyntaxError for unreadable files.
+        """
+        path = os.path.abspath(filepath)
+        st = os.stat(path)
+        with self._lock:
+            cached = self._files.get(path)
+            if cached is not None and cached.mtime_ns == st.st_mtime_ns and cached.size == st.st_size:
+                self._files.move_to_end(path)
+                self.reuses += 1
+                return cached
+
+        with open(path, "rb") as f:
+            raw = f.read()
+        digest = hashlib.sha256(raw).hexdigest()
+
+        with self._lock:
+            cached = self._files.get(path)
+            if cached is not None and cached.digest == digest:
+                # Touched but not changed: keep the parse, refresh the stat key.
+                cached.mtime_ns, cached.size = st.st_mtime_ns, st.st_size
+                self.reuses += 1
+                return cached
+
+        text, encoding = _decode_source(raw)
+        tree = ast.parse(text, filename=path)
+        index = FileIndex(path, st.st_mtime_ns, st.st_size, digest, encoding,
+                          text.splitlines(keepends=True), _collect_functions(tree), _import_line(tree))
+        with self._lock:
+            self._files[path] = index
+            self._files.move_to_end(path)
+            while len(self._files) > self.max_files:
+                self._files.popitem(last=False)
+            self.parses += 1
+        return index
+
+    def resolve(self, filename, lineno, name=None):
+        """
+        Maps a traceback location to (FileIndex, FunctionSpan) for the enclosing function,
+        method or closure. Returns None for module-level code and unreadable files.
+        """
+        try:
+            file_index = self.get(filename)
+        except (OSError, SyntaxError, ValueError):
+            return None
+        span = file_index.enclosing(lineno, name)
+        return (file_index, span) if span is not None else None
+
+    def invalidate(self, filepath):
+        with self._lock:
+            self._files.pop(os.path.abspath(filepath), None)
+
+    def stats(self):
+        return {"files": len(self._files), "parses": self.parses, "reuses": self.reuses}
+
+
+# Shared index used by the error handler and the patcher
+source_index = SourceIndex()
+
+
+def _is_function_definition(code):
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return False, None
+    if len(tree.body) == 1 and isinstance(tree.body[0], (ast.FunctionDef, ast.AsyncFunctionDef)):
+        return True, tree.body[0]
+    return False, None
+
+
+def split_fix(fix_code, name):
+    """
+    Models often answer with the function's def plus the imports it needs. For such a fix, returns
+    (import statements, def source); for anything else ([], the dedented fix). Raises PatchError
+    when a top-level def of `name` comes with other module-level statements, which can neither
+    be spliced in as a body nor placed next to the function safely.
+    """
+    code = textwrap.dedent(fix_code).strip("\n")
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return [], code  # Reported by the caller with its own context
+    if len(tree.body) < 2:
+        return [], code
+    defs = [n for n in tree.body if isinstance(n, (ast.FunctionDef, ast.AsyncFunctionDef)) and n.name == name]
+    if not defs:
+        return [], code
+    others = [n for n in tree.body if n is not defs[0]]
+    if len(defs) > 1 or not all(isinstance(n, (ast.Import, ast.ImportFrom)) for n in others):
+        raise PatchError(f"Fix for '{name}' mixes its definition with other module-level statements.")
+    lines = code.splitlines()
+    node = defs[0]
+    start = min([d.lineno for d in node.decorator_list] + [node.lineno])
+    imports = ["\n".join(lines[n.lineno - 1:n.end_lineno]) for n in others]
+    return imports, "\n".join(lines[start - 1:node.end_lineno])
+
+
+def _indent_block(code, indent, newline="\n"):
+    # `indent` is a column count or the literal whitespace to prefix
+    prefix = indent if isinstance(indent, str) else " " * indent
+    return [(prefix + line if line.strip() else "") + newline for line in code.splitlines()]
+
+
+def _replacement_lines(index, span, new_code, note_lines):
+    """
+    Builds the lines that replace `span` and the import statements the fix needs at module level.
+    A fix that is a complete def (optionally preceded by imports) replaces the whole function;
+    anything else is treated as a new body under the original signature (and the original
+    docstring, unless the fix brings its own). Returns (start line, lines, imports).
+    """
+    imports, code = split_fix(new_code, span.name)
+    newline = index.newline
+    notes = [" " * span.indent + "# " + note + newline for note in (note_lines or [])]
+    is_def, node = _is_function_definition(code)
+
+    if is_def:
+        if node.decorator_list:
+            return span.start_line, notes + _indent_block(code, span.indent, newline), imports
+        # Keep the original decorators when the fix only contains the bare def
+        decorators = index.lines[span.start_line - 1:span.def_line - 1]
+        return span.start_line, decorators + notes + _indent_block(code, span.indent, newline), imports
+
+    if span.body_line == span.def_line:
+        raise PatchError(f"'{span.qualname}' is a one-line function; the fix must be a complete definition.")
+    try:
+        body = ast.parse(code).body
+    except SyntaxError as e:
+        raise PatchError(f"Fix for '{span.qualname}' is not valid Python: {e}")
+    header_end = span.body_line - 1
+    if span.docstring_end_line is not None and not (body and _is_docstring(body[0])):
+        header_end = span.docstring_end_line
+    header = index.lines[span.start_line - 1:header_end]
+    first_body_line = index.lines[span.body_line - 1]
+    body_indent = first_body_line[:len(first_body_line) - len(first_body_line.lstrip())]
+    return span.start_line, notes + header + _indent_block(code, body_indent, newline), []
+
+
+def atomic_write(filepath, text, encoding="utf-8"):
+    """
+    Writes `text` to a temp file in the same directory and renames it over `filepath`,
+    so readers never see a half-written file.
+    """
+    directory = os.path.dirname(os.path.abspath(filepath))
+    fd, tmp_path = tempfile.mkstemp(prefix=".pyfixer-", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding=encoding, newline="") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            os.chmod(tmp_path, os.stat(filepath).st_mode & 0o7777)
+        except OSError:
+            pass
+        os.replace(tmp_path, filepath)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def render_function_fixes(filepath, fixes, note_lines=None, index=None):
+    """
+    Builds the patched text of `filepath` without writing it.
+    Returns (new_text, patched qualified names, FileIndex). Raises PatchError on any failure.
+    """
+    index = index or source_index
+    try:
+        file_index = index.get(filepath)
+    except (OSError, SyntaxError) as e:
+        raise PatchError(f"Could not index {filepath}: {e}")
+
+    splices, imports = [], []
+    for name, new_code in fixes.items():
+        span = file_index.find(name)
+        if span is None:
+            raise PatchError(f"Could not find function '{name}' in {filepath}.")
+        start_line, replacement, fix_imports = _replacement_lines(file_index, span, new_code, note_lines)
+        splices.append((start_line, span.end_line, span.qualname, replacement))
+        imports.extend(fix_imports)
+    qualnames = [s[2] for s in sorted(splices, key=lambda s: s[0])]
+
+    # Imports that came with a fix go to module level, unless the file already has them
+    existing = {line.strip() for line in file_index.lines}
+    new_imports = []
+    for statement in imports:
+        if statement.strip() not in existing and statement not in new_imports:
+            new_imports.append(statement)
+    if new_imports:
+        at = file_index.import_line
+        splices.append((at + 1, at, "<imports>", _indent_block("\n".join(new_imports), 0, file_index.newline)))
+
+    splices.sort(key=lambda s: (s[0], s[1]))
+    for previous, current in zip(splices, splices[1:]):
+        if current[0] <= previous[1]:
+            raise PatchError(f"Fixes for '{previous[2]}' and '{current[2]}' overlap.")
+
+    new_lines = list(file_index.lines)
+    if new_lines and not new_lines[-1].endswith(("\n", "\r")):
+        new_lines[-1] += file_index.newline
+    for start_line, end_line, _, replacement in reversed(splices):
+        new_lines[start_line - 1:end_line] = replacement
+
+    new_text = "".join(new_lines)
+    try:
+        ast.parse(new_text, filename=filepath)
+    except SyntaxError as e:
+        raise PatchError(f"Patched file would not compile: {e}")
+    return new_text, qualnames, file_index
+
+
+def apply_function_fixes(filepath, fixes, note_lines=None, index=None):
+    """
+    Applies several function fixes to one file in a single read/write pass.
+    `fixes` maps a (qualified) function name to its corrected code.
+    Returns the list of patched qualified names. Raises PatchError on any failure,
+    in which case the file is not modified.
+    """
+    index = index or source_index
+    new_text, qualnames, file_index = render_function_fixes(filepath, fixes, note_lines, index)
+    for qualname in qualnames:
+        span = file_index.functions[qualname]
+        log.info("Found '%s' at lines %d-%d.", qualname, span.start_line, span.end_line)
+
+    atomic_write(filepath, new_text, encoding=file_index.encoding)
+    index.invalidate(filepath)
+    return qualnames
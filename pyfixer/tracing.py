@@ -0,0 +1,311 @@
+import os
+import json
+import atexit
+import time
+import logging
+import threading
+from datetime import datetime
+
+# --- Tracing, Metrics and Logging ---
+# Monotonic-clock spans around the pipeline stages (handler, lookup, prompt, api, ui_wait,
+# patch, ...) and counters (api_calls, cache_hits, fixes_accepted, tokens_sent, ...).
+# Finished spans go to a rotating JSONL file; span totals and counters are also served in
+# Prometheus text format. Tracing is off until configure() is called: span() then returns a
+# shared no-op object and incr() returns immediately.
+#
+#   PYFIXER_TRACE_FILE=trace.jsonl PYFIXER_METRICS_PORT=9464 python main.py
+#   curl http://127.0.0.1:9464/metrics
+#
+# Console output goes through the "pyfixer" logger (get_logger), so messages are only
+# formatted when the level is enabled (PYFIXER_LOG_LEVEL, default INFO).
+
+DEFAULT_MAX_BYTES = 10 * 1024 * 1024
+DEFAULT_BACKUPS = 3
+
+_enabled = False
+_lock = threading.Lock()
+_local = threading.local()
+_exporters = []
+_counters = {}
+_span_totals = {}     # span name -> [count, total seconds, errors]
+_next_span_id = 0
+_metrics_server = None
+
+
+# --- Logging ---
+_log_configured = False
+
+
+def get_logger(tag):
+    """
+    Returns the logger for one component. Messages print as "[HH:MM:SS.mmm] [Tag] message";
+    pass arguments %-style so they are only formatted when the message is emitted.
+    """
+    global _log_configured
+    if not _log_configured:
+        root = logging.getLogger("pyfixer")
+        if not root.handlers:
+            handler = logging.StreamHandler()
+            handler.setFormatter(logging.Formatter("[%(asctime)s.%(msecs)03d] [%(tag)s] %(message)s", "%H:%M:%S"))
+            handler.addFilter(_TagFilter())
+            root.addHandler(handler)
+            root.setLevel(os.environ.get("PYFIXER_LOG_LEVEL", "INFO").upper())
+            root.propagate = False
+        _log_configured = True
+    return logging.getLogger("pyfixer." + tag)
+
+
+class _TagFilter(logging.Filter):
+    def filter(self, record):
+        record.tag = record.name.rsplit(".", 1)[-1]
+        return True
+
+
+# --- Spans ---
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """
+    One timed stage. Nested spans on the same thread record their parent's id.
+    """
+    __slots__ = ("name", "attrs", "span_id", "parent_id", "start_time", "_started_ns")
+
+    def __init__(self, name, attrs):
+        global _next_span_id
+        self.name = name
+        self.attrs = attrs
+        with _lock:
+            _next_span_id += 1
+            self.span_id = _next_span_id
+        self.parent_id = None
+        self.start_time = None
+        self._started_ns = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        self.parent_id = stack[-1].span_id if stack else None
+        stack.append(self)
+        self.start_time = time.time()
+        self._started_ns = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_value, exc_traceback):
+        duration = (time.perf_counter_ns() - self._started_ns) / 1e9
+        stack = _local.stack
+        if stack and stack[-1] is self:
+            stack.pop()
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        with _lock:
+            totals = _span_totals.setdefault(self.name, [0, 0.0, 0])
+            totals[0] += 1
+            totals[1] += duration
+            totals[2] += exc_type is not None
+        _export({
+            "type": "span", "name": self.name, "span_id": self.span_id, "parent_id": self.parent_id,
+            "thread": threading.current_thread().name, "start": round(self.start_time, 6),
+            "duration_ms": round(duration * 1000, 3), "attrs": self.attrs,
+        })
+        return False
+
+
+def span(name, **attrs):
+    """
+    Times a block: `with tracing.span("api", backend="gemini"): ...`. No-op while tracing is off.
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return Span(name, attrs)
+
+
+def incr(name, value=1):
+    """
+    Adds `value` to the counter `name`. No-op while tracing is off.
+    """
+    if not _enabled:
+        return
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + value
+
+
+def is_enabled():
+    return _enabled
+
+
+def snapshot():
+    """
+    Current counters and span totals as a dict.
+    """
+    with _lock:
+        return {
+            "counters": dict(_counters),
+            "spans": {name: {"count": c, "total_seconds": round(t, 6), "errors": e} for name, (c, t, e) in _span_totals.items()},
+        }
+
+
+# --- Exporters ---
+class JSONLExporter:
+    """
+    Appends one JSON object per finished span, rotating the file at `max_bytes`
+    (trace.jsonl -> trace.jsonl.1 -> ... -> trace.jsonl.<backups>).
+    """
+
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES, backups=DEFAULT_BACKUPS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backups = backups
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def export(self, record):
+        line = json.dumps(record, default=str) + "\n"
+        with self._lock:
+            if self.max_bytes and self._file.tell() + len(line) > self.max_bytes:
+                self._rotate()
+            self._file.write(line)
+            self._file.flush()
+
+    def _rotate(self):
+        self._file.close()
+        for n in range(self.backups - 1, 0, -1):
+            source = f"{self.path}.{n}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{n + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+def _export(record):
+    for exporter in _exporters:
+        try:
+            exporter.export(record)
+        except Exception:
+            pass  # Tracing must never break the application
+
+
+def render_prometheus():
+    """
+    Counters and span totals in the Prometheus text exposition format.
+    """
+    data = snapshot()
+    lines = []
+    for name, value in sorted(data["counters"].items()):
+        metric = f"pyfixer_{name}_total"
+        lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+    if data["spans"]:
+        lines.append("# TYPE pyfixer_span_duration_seconds summary")
+        for name, totals in sorted(data["spans"].items()):
+            lines.append(f'pyfixer_span_duration_seconds_count{{span="{name}"}} {totals["count"]}')
+            lines.append(f'pyfixer_span_duration_seconds_sum{{span="{name}"}} {totals["total_seconds"]}')
+        lines.append("# TYPE pyfixer_span_errors_total counter")
+        for name, totals in sorted(data["spans"].items()):
+            lines.append(f'pyfixer_span_errors_total{{span="{name}"}} {totals["errors"]}')
+    return "\n".join(lines) + "\n"
+
+
+def _metrics_handler_class():
+    from http.server import BaseHTTPRequestHandler
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return MetricsHandler
+
+
+def start_metrics_server(port, host="127.0.0.1"):
+    """
+    Serves /metrics on a daemon thread. Returns the server (port 0 picks a free port).
+    """
+    global _metrics_server
+    if _metrics_server is None:
+        from http.server import ThreadingHTTPServer
+        _metrics_server = ThreadingHTTPServer((host, port), _metrics_handler_class())
+        _metrics_server.daemon_threads = True
+        threading.Thread(target=_metrics_server.serve_forever, name="pyfixer-metrics", daemon=True).start()
+        get_logger("Tracing").info("Metrics at http://%s:%d/metrics", host, _metrics_server.server_address[1])
+    return _metrics_server
+
+
+# --- Setup ---
+def configure(jsonl_path=None, prometheus_port=None, max_bytes=DEFAULT_MAX_BYTES, backups=DEFAULT_BACKUPS):
+    """
+    Turns tracing on and attaches the requested exporters. Counters and span totals are kept
+    in memory either way (see snapshot()).
+    """
+    global _enabled
+    with _lock:
+        if not _enabled and not _exporters:
+            atexit.register(shutdown)
+        if jsonl_path and not any(isinstance(e, JSONLExporter) and e.path == jsonl_path for e in _exporters):
+            _exporters.append(JSONLExporter(jsonl_path, max_bytes, backups))
+        _enabled = True
+    if prometheus_port is not None:
+        start_metrics_server(prometheus_port)
+
+
+def configure_from_env():
+    """
+    Enables tracing when PYFIXER_TRACE_FILE and/or PYFIXER_METRICS_PORT are set. Returns whether it did.
+    """
+    path = os.environ.get("PYFIXER_TRACE_FILE")
+    port = os.environ.get("PYFIXER_METRICS_PORT")
+    if not path and not port:
+        return False
+    configure(jsonl_path=path or None, prometheus_port=int(port) if port else None,
+              max_bytes=int(os.environ.get("PYFIXER_TRACE_MAX_BYTES", DEFAULT_MAX_BYTES)))
+    return True
+
+
+def shutdown():
+    """
+    Writes the final counters to the JSONL exporters and turns tracing off.
+    """
+    global _enabled
+    if not _enabled:
+        return
+    _export(dict(snapshot(), type="summary", time=datetime.now().isoformat(timespec="seconds")))
+    with _lock:
+        _enabled = False
+        exporters = list(_exporters)
+        _exporters.clear()
+    for exporter in exporters:
+        exporter.close()